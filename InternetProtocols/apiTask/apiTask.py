@@ -1,79 +1,107 @@
-from json import loads as json_loads
+from json import dumps as json_dumps
 from argparse import ArgumentParser
-from urllib.request import Request, urlopen
-
-
-def get_list_of_friend(user_id: str, token: str, version: str) -> dict:
-    if not user_id.isdigit():
-        try:
-            user_id = get_user_id_by_name(user_id, token, version)
-        except KeyError:
-            raise ValueError("Input user doesn't exist!")
-
-    friends_list_request = (
-        f'https://api.vk.com/method/friends.get?user_id={user_id}'
-        f'&order=name&fields=nickname,domain'
-        f'&access_token={token}'
-        f'&v={version}'
-    )
-
+from typing import Iterator
+
+from vkApi import API_URL, FRIENDS_PAGE, VERSION, VkApi, VkApiError, crawl_friends
+
+
+def get_list_of_friend(user_id: str, api: VkApi) -> dict:
+    # one friends.get holds at most FRIENDS_PAGE friends, the rest are read with offset
+    user_id = resolve_user_id(user_id, api)
+    answer = api.call("friends.get", user_id=user_id, order="name", fields="nickname,domain",
+                      count=FRIENDS_PAGE, offset=0)
+    while len(answer["items"]) < answer["count"]:
+        page = api.call("friends.get", user_id=user_id, order="name", fields="nickname,domain",
+                        count=FRIENDS_PAGE, offset=len(answer["items"]))
+        if not page["items"]:
+            break
+        answer["items"].extend(page["items"])
+    return answer
+
+
+def iter_friends(user_id: str, api: VkApi) -> Iterator[dict]:
+    # friends as they are decoded from the answer, without holding the whole list;
+    # pages are read with offset until a short one
+    user_id = resolve_user_id(user_id, api)
+    offset = 0
+    while True:
+        received = 0
+        for person in api.stream("friends.get", user_id=user_id, order="name", fields="nickname,domain",
+                                 count=FRIENDS_PAGE, offset=offset):
+            received += 1
+            yield person
+        if received < FRIENDS_PAGE:
+            return
+        offset += FRIENDS_PAGE
+
+
+def get_message_list(user_id: str, api: VkApi):
+    return get_list_of_friend(user_id, api)
+
+
+def resolve_user_id(user_id: str, api: VkApi) -> str:
+    if user_id.isdigit():
+        return user_id
     try:
-        return make_request_and_parse(friends_list_request)["response"]
-    except KeyError:
-        raise KeyError(f"{make_request_and_parse(friends_list_request)['error']['error_msg']}")
+        return str(get_user_id_by_name(user_id, api))
+    except (KeyError, IndexError, VkApiError):
+        raise ValueError("Input user doesn't exist!")
 
 
-def get_message_list(user_id: str, token: str, version: str):
-    if not user_id.isdigit():
-        try:
-            user_id = get_user_id_by_name(user_id, token, version)
-        except KeyError:
-            raise ValueError("Input user doesn't exist!")
+def get_user_id_by_name(name: str, api: VkApi) -> int:
+    return api.call("users.get", user_ids=name)[0]["id"]
 
-    friends_list_request = (
-        f'https://api.vk.com/method/friends.get?user_id={user_id}'
-        f'&order=name&fields=nickname,domain'
-        f'&access_token={token}'
-        f'&v={version}'
-    )
 
-    try:
-        return make_request_and_parse(friends_list_request)["response"]
-    except KeyError:
-        raise KeyError(f"{make_request_and_parse(friends_list_request)['error']['error_msg']}")
+def write_friends(user_id: str, api: VkApi, output: str, output_format: str) -> None:
+    with open(output, 'w', encoding='utf-8') as file:
+        for i, person in enumerate(iter_friends(user_id, api)):
+            line = f"{person['first_name']} {person['last_name']}"
+            if output_format == 'jsonl':
+                file.write(json_dumps(person, ensure_ascii=False) + '\n')
+            else:
+                file.write(('\n' if i else '') + line)
+            print(line)
 
 
-def get_user_id_by_name(name: str, token: str, version: str) -> str:
-    request = (
-        f"https://api.vk.com/method/users.get?user_id={name}"
-        f"&access_token={token}"
-        f"&v={version}"
-    )
-    return make_request_and_parse(request)["response"][0]["id"]
+def crawl(names: list[str], depth: int, api: VkApi, output: str) -> None:
+    ids = api.resolve_ids(names)
+    missing = [name for name in names if name not in ids]
+    if missing:
+        raise ValueError(f"Users don't exist: {', '.join(missing)}")
 
-
-def make_request_and_parse(request_message) -> dict:
-    return json_loads(make_request(request_message))
-
-
-def make_request(request_message) -> bytes:
-    return urlopen(Request(request_message)).read()
+    users = 0
+    with open(output, 'w', encoding='utf-8') as file:
+        for user_id, friends in crawl_friends(api, list(dict.fromkeys(ids.values())), depth):
+            file.write(json_dumps({"id": user_id, "friends": friends}) + "\n")
+            users += 1
+    print(f"{users} users, {api.requests} requests -> {output}")
 
 
 def config_argparse(arg_parser: ArgumentParser) -> None:
-    arg_parser.add_argument('user_id', type=str, help='User id')
+    arg_parser.add_argument('user_id', type=str, help='User id, several comma separated ids for --depth')
     arg_parser.add_argument('token', type=str, help='Your access token')
+    arg_parser.add_argument('--depth', type=int, default=0,
+                            help='Crawl the friend graph this many levels deep instead of printing the friend list')
+    arg_parser.add_argument('--output', type=str, default='',
+                            help='Result file, response.txt or response.jsonl, friends_graph.jsonl for --depth')
+    arg_parser.add_argument('--format', type=str, choices=('txt', 'jsonl'), default='txt',
+                            help='txt: first and last names, jsonl: every friend as a JSON object')
+    arg_parser.add_argument('--rps', type=float, default=3, help='Requests per second')
+    arg_parser.add_argument('--api-url', type=str, default=API_URL, help='API address, for a local mock server')
 
 
 def main():
     arg_parser = ArgumentParser()
     config_argparse(arg_parser)
     args = arg_parser.parse_args()
-    api_response = get_list_of_friend(args.user_id, args.token, "5.131")["items"]
-    with open('response.txt', 'w', encoding='utf-8') as file:
-        answer = '\n'.join([f"{person['first_name']} {person['last_name']}" for person in api_response])
-        file.write(answer)
-        print(answer)
+    api = VkApi(args.token, VERSION, args.api_url, args.rps)
+    try:
+        if args.depth > 0:
+            crawl(args.user_id.split(','), args.depth, api, args.output or 'friends_graph.jsonl')
+        else:
+            write_friends(args.user_id, api, args.output or f'response.{args.format}', args.format)
+    finally:
+        api.close()
 
 
 if __name__ == "__main__":
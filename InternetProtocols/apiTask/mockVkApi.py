@@ -0,0 +1,138 @@
+import random
+import threading
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps as json_dumps, loads as json_loads
+from re import compile as re_compile
+from urllib.parse import parse_qsl, urlsplit
+
+# A local stand-in for api.vk.com: a random friend graph behind users.get, friends.get and the
+# execute calls VkApi builds, so the crawler can be run and timed without a token.
+CALL_REG = re_compile(r"API\.([\w.]+)\((\{[^{}]*\})\)")
+PRIVATE = 30
+
+
+class MockVkApi:
+    def __init__(self, users: int = 10000, friends: int = 100, seed: int = 1, private: float = 0.05):
+        self.users = users
+        self.friends = friends
+        self.seed = seed
+        self.private = private
+        self.requests = 0
+        self._server: ThreadingHTTPServer | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/method/"
+
+    def start(self, port: int = 0) -> "MockVkApi":
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                params = dict(parse_qsl(self.rfile.read(length).decode()))
+                self.__answer(urlsplit(self.path).path.rsplit("/", 1)[-1], params)
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                self.__answer(url.path.rsplit("/", 1)[-1], dict(parse_qsl(url.query)))
+
+            def __answer(self, method: str, params: dict):
+                mock.requests += 1
+                body = json_dumps(mock.answer(method, params)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def answer(self, method: str, params: dict) -> dict:
+        if method == "execute":
+            results, errors = list(), list()
+            for name, args in CALL_REG.findall(params.get("code", "")):
+                answer = self.answer(name, json_loads(args))
+                if "error" in answer:
+                    results.append(False)
+                    errors.append({"method": name} | answer["error"])
+                else:
+                    results.append(answer["response"])
+            return {"response": results} | ({"execute_errors": errors} if errors else {})
+        if method == "users.get":
+            users = list()
+            for name in str(params.get("user_ids", params.get("user_id", ""))).split(","):
+                user_id = self.user_id(name)
+                if user_id is not None:
+                    users.append(self.user(user_id))
+            return {"response": users}
+        if method == "friends.get":
+            user_id = self.user_id(str(params.get("user_id", "")))
+            if user_id is None:
+                return error(100, "One of the parameters specified was missing or invalid: user_id is undefined")
+            if self.is_private(user_id):
+                return error(PRIVATE, "This profile is private")
+            friends = self.friends_of(user_id)
+            offset = int(params.get("offset", 0))
+            page = friends[offset:offset + int(params.get("count", 5000))]
+            items = [self.user(friend) for friend in page] if params.get("fields") else page
+            return {"response": {"count": len(friends), "items": items}}
+        return error(3, "Unknown method passed")
+
+    def user_id(self, name: str) -> int | None:
+        name = name.strip()
+        if name.startswith("id") and name[2:].isdigit():
+            name = name[2:]
+        elif name.startswith("user"):
+            name = name[4:]
+        return int(name) if name.isdigit() and 0 < int(name) <= self.users else None
+
+    def is_private(self, user_id: int) -> bool:
+        return random.Random(self.seed * 7919 + user_id).random() < self.private
+
+    def friends_of(self, user_id: int) -> list[int]:
+        rng = random.Random(self.seed * 104729 + user_id)
+        # a few popular accounts have more friends than one friends.get page holds
+        count = rng.randint(6000, 9000) if user_id % 1000 == 0 else rng.randint(0, 2 * self.friends)
+        return sorted(rng.sample(range(1, self.users + 1), min(count, self.users)))
+
+    @staticmethod
+    def user(user_id: int) -> dict:
+        return {"id": user_id, "first_name": f"Name{user_id}", "last_name": f"Surname{user_id}",
+                "domain": f"user{user_id}", "screen_name": f"user{user_id}", "nickname": ""}
+
+
+def error(code: int, message: str) -> dict:
+    return {"error": {"error_code": code, "error_msg": message}}
+
+
+def main() -> None:
+    arg_parser = ArgumentParser(description="Serve a random friend graph in the shape of the VK API")
+    arg_parser.add_argument("--port", type=int, default=8080)
+    arg_parser.add_argument("--users", type=int, default=10000)
+    arg_parser.add_argument("--friends", type=int, default=100, help="average friends per user")
+    arg_parser.add_argument("--seed", type=int, default=1)
+    args = arg_parser.parse_args()
+    mock = MockVkApi(args.users, args.friends, args.seed).start(args.port)
+    print(f"serving {mock.url}, Enter to stop")
+    input()
+    mock.stop()
+    print(f"{mock.requests} requests")
+
+
+if __name__ == "__main__":
+    main()
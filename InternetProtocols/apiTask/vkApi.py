@@ -0,0 +1,212 @@
+import time
+from codecs import getincrementaldecoder
+from http.client import HTTPConnection, HTTPResponse, HTTPSConnection, HTTPException
+from json import JSONDecodeError, JSONDecoder, dumps as json_dumps, loads as json_loads
+from re import compile as re_compile
+from typing import BinaryIO, Iterator
+from urllib.parse import urlencode, urlsplit
+
+API_URL = "https://api.vk.com/method/"
+VERSION = "5.131"
+# limits of the VK API: calls inside one execute, ids in one users.get, friends in one friends.get page
+EXECUTE_LIMIT = 25
+USERS_LIMIT = 1000
+FRIENDS_PAGE = 5000
+TOO_MANY_REQUESTS = 6
+CHUNK_SIZE = 1 << 16
+SEPARATORS_REG = re_compile(r"[\s,]*")
+
+
+class VkApiError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+
+    def take(self) -> None:
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            time.sleep((1 - self._tokens) / self.rate)
+
+
+class VkApi:
+    # one keep-alive connection for every call, at most `rate` requests per second
+    def __init__(self, token: str, version: str = VERSION, api_url: str = API_URL, rate: float = 3,
+                 timeout: float = 10, retries: int = 3):
+        url = urlsplit(api_url)
+        self.token = token
+        self.version = version
+        self.path = url.path.rstrip("/") + "/"
+        self.retries = retries
+        self.bucket = TokenBucket(rate, max(int(rate), 1))
+        self.requests = 0
+        connection_class = HTTPSConnection if url.scheme == "https" else HTTPConnection
+        self._connection = connection_class(url.netloc, timeout=timeout)
+
+    def call(self, method: str, **params) -> object:
+        for attempt in range(self.retries + 1):
+            try:
+                return check_answer(json_loads(self.__post(method, params).read()))
+            except VkApiError as err:
+                if err.code != TOO_MANY_REQUESTS or attempt == self.retries:
+                    raise
+            time.sleep(1)
+
+    def stream(self, method: str, key: str = "items", **params) -> Iterator:
+        # items of the `key` array of the answer, decoded while the answer is still being received
+        for attempt in range(self.retries + 1):
+            response = self.__post(method, params)
+            try:
+                yield from iter_items(response, key)
+                return
+            except VkApiError as err:
+                if err.code != TOO_MANY_REQUESTS or attempt == self.retries:
+                    raise
+            finally:
+                if not response.isclosed():
+                    # abandoned halfway: the rest of the answer would be read as the next one
+                    self._connection.close()
+            time.sleep(1)
+
+    def execute(self, calls: list[tuple[str, dict]]) -> list:
+        # up to EXECUTE_LIMIT calls in one request; a failed call gives None in its place
+        code = "return [" + ",".join(f"API.{method}({json_dumps(params)})" for method, params in calls) + "];"
+        results = self.call("execute", code=code)
+        return [None if result is False else result for result in results]
+
+    def resolve_ids(self, names: list[str]) -> dict[str, int]:
+        # Screen names and numeric ids alike, USERS_LIMIT per users.get call. Unknown and deleted
+        # accounts are left out of the answer, so users are matched to the names by id or screen
+        # name; a name that matches none is left out of the result.
+        ids = dict()
+        for i in range(0, len(names), USERS_LIMIT):
+            chunk = names[i:i + USERS_LIMIT]
+            found = dict()
+            for user in self.call("users.get", user_ids=",".join(chunk), fields="screen_name"):
+                for name in (str(user["id"]), f"id{user['id']}", user.get("screen_name"), user.get("domain")):
+                    if name:
+                        found[name.lower()] = user["id"]
+            for name in chunk:
+                if name.strip().lower() in found:
+                    ids[name] = found[name.strip().lower()]
+        return ids
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __post(self, method: str, params: dict) -> HTTPResponse:
+        body = urlencode(params | {"access_token": self.token, "v": self.version})
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        self.bucket.take()
+        self.requests += 1
+        try:
+            self._connection.request("POST", self.path + method, body, headers)
+            response = self._connection.getresponse()
+        except (HTTPException, OSError):
+            # the server closed the idle connection, the next request opens a new one
+            self._connection.close()
+            self._connection.request("POST", self.path + method, body, headers)
+            response = self._connection.getresponse()
+        return response
+
+
+def check_answer(answer: dict) -> object:
+    if "error" in answer:
+        error = answer["error"]
+        raise VkApiError(error.get("error_code", 0), error.get("error_msg", "unknown error"))
+    return answer["response"]
+
+
+def iter_items(stream: BinaryIO, key: str = "items", chunk_size: int = CHUNK_SIZE) -> Iterator:
+    # Items of the first "key": [...] array of a JSON answer, one at a time: only the undecoded
+    # tail of the last chunk is kept, so memory does not grow with the size of the answer.
+    array_start = re_compile(rf'"{key}"\s*:\s*\[')
+    decoder = JSONDecoder()
+    text = getincrementaldecoder("utf-8")()
+    buffer = ""
+    while True:
+        chunk = stream.read(chunk_size)
+        buffer += text.decode(chunk, final=not chunk)
+        match = array_start.search(buffer)
+        if match:
+            break
+        if not chunk:
+            # no array: an error answer or an empty one, small either way
+            check_answer(json_loads(buffer))
+            return
+
+    position, eof = match.end(), False
+    while True:
+        position = SEPARATORS_REG.match(buffer, position).end()
+        if buffer.startswith("]", position):
+            break
+        if position < len(buffer):
+            try:
+                item, end = decoder.scan_once(buffer, position)
+            except (StopIteration, JSONDecodeError):
+                end = None
+            # a number cut by the chunk border decodes too, so an item counts once its separator is seen
+            if end is not None and (eof or end < len(buffer) and buffer[end] in ",] \t\r\n"):
+                yield item
+                position = end
+                continue
+        if eof:
+            raise ValueError("truncated answer")
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + text.decode(chunk, final=eof)
+        position = 0
+
+    # the rest of the answer has to be read before the connection takes the next request
+    while stream.read(chunk_size):
+        pass
+
+
+def crawl_friends(api: VkApi, roots: list[int], depth: int) -> Iterator[tuple[int, list[int] | None]]:
+    # Breadth first over the friend graph, EXECUTE_LIMIT users per request. Users are yielded
+    # batch by batch, so only one batch of friend lists is held at a time; private profiles give None.
+    seen = set(roots)
+    level = list(roots)
+    for distance in range(depth):
+        next_level = list()
+        for i in range(0, len(level), EXECUTE_LIMIT):
+            for user_id, friends in _friends_batch(api, level[i:i + EXECUTE_LIMIT]):
+                yield user_id, friends
+                if distance + 1 < depth:
+                    for friend_id in friends or ():
+                        if friend_id not in seen:
+                            seen.add(friend_id)
+                            next_level.append(friend_id)
+        level = next_level
+
+
+def _friends_batch(api: VkApi, users: list[int]) -> list[tuple[int, list[int] | None]]:
+    # lists longer than FRIENDS_PAGE are read with offset in the next requests
+    friends: dict[int, list[int] | None] = dict()
+    calls = [(user_id, 0) for user_id in users]
+    while calls:
+        more_calls = list()
+        results = api.execute([
+            ("friends.get", {"user_id": user_id, "count": FRIENDS_PAGE, "offset": offset}) for user_id, offset in calls
+        ])
+        for (user_id, offset), result in zip(calls, results):
+            if result is None:
+                friends[user_id] = None
+                continue
+            friends.setdefault(user_id, list()).extend(result["items"])
+            if offset + FRIENDS_PAGE < result["count"]:
+                more_calls.append((user_id, offset + FRIENDS_PAGE))
+        calls = more_calls
+    return [(user_id, friends[user_id]) for user_id in users]
@@ -0,0 +1,79 @@
+import gc
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+from dnslib import A, DNSLabel, QTYPE, RR
+
+from domain.dnsStuff import CacheKey, CacheValue
+
+
+class LegacyCacheKey:
+    def __init__(self, name: DNSLabel, q_type: int):
+        self.name = name
+        self.q_type = q_type
+
+    def __hash__(self):
+        return hash(self.name) * hash(self.q_type)
+
+    def __eq__(self, other):
+        if other is None or type(other).__name__ != "LegacyCacheKey":
+            return False
+        else:
+            return (self.name == other.name and
+                    self.q_type == other.q_type)
+
+
+class LegacyCacheValue:
+    def __init__(self, ttl: int, data: list[RR], authoritative: bool):
+        self.expiry_time = ttl
+        self.data = data
+        self.auth = authoritative
+
+
+def build(names: list[str], make_key, make_value) -> tuple[dict, float]:
+    gc.collect()
+    tracemalloc.start()
+    cache = {make_key(name, QTYPE.A): make_value(name) for name in names}
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cache, size / len(names)
+
+
+def lookups_per_second(cache: dict, probes: list) -> float:
+    started = time.perf_counter()
+    for key in probes:
+        cache[key]
+    return len(probes) / (time.perf_counter() - started)
+
+
+def main() -> None:
+    arg_parser = ArgumentParser(description="Dict lookup throughput and per-entry memory of cache keys/values")
+    arg_parser.add_argument("-n", "--names", type=int, default=1_000_000)
+    args = arg_parser.parse_args()
+
+    names = [f"host{i}.zone{i % 1000}.example.com" for i in range(args.names)]
+    offsets = (40,)
+    cases = (
+        (
+            "legacy",
+            lambda name, q_type: LegacyCacheKey(DNSLabel(name), q_type),
+            lambda name: LegacyCacheValue(0, [RR(name, rdata=A("192.0.2.1"), ttl=60)], True)
+        ),
+        (
+            "slotted",
+            lambda name, q_type: CacheKey.from_label(DNSLabel(name), q_type),
+            lambda name: CacheValue(0, bytes(64), offsets, 0)
+        ),
+    )
+
+    print(f"{'keys':>8} {'bytes/entry':>12} {'lookups/s':>12}")
+    for title, make_key, make_value in cases:
+        cache, per_entry = build(names, make_key, make_value)
+        probes = [make_key(name, QTYPE.A) for name in names]
+        print(f"{title:>8} {per_entry:>12.0f} {lookups_per_second(cache, probes):>12.0f}")
+        del cache, probes
+
+
+if __name__ == "__main__":
+    main()
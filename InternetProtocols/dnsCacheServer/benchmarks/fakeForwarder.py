@@ -0,0 +1,99 @@
+import heapq
+import random
+import selectors
+import socket
+import threading
+import time
+from ipaddress import IPv4Address
+from zlib import crc32
+
+from dnslib import A, AAAA, DNSRecord, MX, QTYPE, RCODE, RR, SOA, TXT
+
+
+class FakeForwarder:
+    # Tiny upstream stand-in: answers A/AAAA/MX/TXT queries with data derived from the name,
+    # NXDOMAIN for names starting with "nx" and NODATA for other types,
+    # optionally after `delay` seconds and dropping a `loss` fraction of queries.
+    def __init__(
+            self,
+            address: tuple[str, int] = ("127.0.0.1", 0),
+            delay: float = 0.0,
+            loss: float = 0.0,
+            ttl: int = 300,
+            seed: int = 0
+    ):
+        self.delay = delay
+        self.loss = loss
+        self.ttl = ttl
+        self.queries = 0
+        self._random = random.Random(seed)
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind(address)
+        self._sock.setblocking(False)
+        self.address = self._sock.getsockname()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self.__serve, daemon=True)
+
+    def start(self) -> "FakeForwarder":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self._sock.close()
+
+    def answer(self, req_bytes: bytes) -> bytes:
+        request = DNSRecord.parse(req_bytes)
+        reply = request.reply()
+        name = request.q.qname
+        digest = crc32(str(name).lower().encode())
+        match request.q.qtype:
+            case _ if str(name).lower().startswith("nx"):
+                reply.header.rcode = RCODE.NXDOMAIN
+                self.__add_soa(reply)
+            case QTYPE.A:
+                reply.add_answer(RR(name, QTYPE.A, rdata=A(str(IPv4Address(digest | 0x01000000))), ttl=self.ttl))
+            case QTYPE.AAAA:
+                reply.add_answer(RR(name, QTYPE.AAAA, rdata=AAAA(f"2001:db8::{digest >> 16:x}:{digest & 0xFFFF:x}"), ttl=self.ttl))
+            case QTYPE.MX:
+                reply.add_answer(RR(name, QTYPE.MX, rdata=MX(f"mail.{name}", 10), ttl=self.ttl))
+            case QTYPE.TXT:
+                reply.add_answer(RR(name, QTYPE.TXT, rdata=TXT(f"v=spf1 -all {digest:08x}"), ttl=self.ttl))
+            case _:
+                self.__add_soa(reply)
+        return reply.pack()
+
+    def __add_soa(self, reply: DNSRecord) -> None:
+        # negative answers carry the zone SOA, its MINIMUM bounds how long they may be cached
+        reply.add_auth(RR(
+            "example.com",
+            QTYPE.SOA,
+            rdata=SOA("ns0.example.com", "hostmaster.example.com", (1, 3600, 600, 86400, self.ttl)),
+            ttl=self.ttl
+        ))
+
+    def __serve(self) -> None:
+        selector = selectors.DefaultSelector()
+        selector.register(self._sock, selectors.EVENT_READ)
+        pending: list[tuple[float, int, bytes, tuple]] = list()
+        counter = 0
+        while not self._stopped.is_set():
+            timeout = 0.1 if not pending else max(0.0, pending[0][0] - time.monotonic())
+            if selector.select(timeout):
+                while True:
+                    try:
+                        data, addr = self._sock.recvfrom(65535)
+                    except BlockingIOError:
+                        break
+                    self.queries += 1
+                    if self._random.random() < self.loss:
+                        continue
+                    counter += 1
+                    heapq.heappush(pending, (time.monotonic() + self.delay, counter, self.answer(data), addr))
+            now = time.monotonic()
+            while pending and pending[0][0] <= now:
+                _, _, answer, addr = heapq.heappop(pending)
+                self._sock.sendto(answer, addr)
+        selector.close()
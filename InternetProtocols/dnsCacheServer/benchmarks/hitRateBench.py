@@ -0,0 +1,93 @@
+import random
+from argparse import ArgumentParser
+from itertools import accumulate
+
+from dnslib import DNSRecord, QTYPE, RCODE
+
+from benchmarks.fakeForwarder import FakeForwarder
+from domain.cacheStore import CacheStore
+from domain.dnsStuff import CacheKey, CacheValue
+from domain.wire import analyze_answer, read_question
+
+QTYPE_MIX = (("A", 55), ("AAAA", 25), ("MX", 5), ("TXT", 5), ("SRV", 5), ("HTTPS", 5))
+
+
+def legacy_policy(answer: bytes) -> tuple[int, bool] | None:
+    # the old server cached positive A/NS/PTR answers only
+    reply = DNSRecord.parse(answer)
+    if reply.q.qtype not in (QTYPE.A, QTYPE.NS, QTYPE.PTR) or reply.header.rcode != RCODE.NOERROR or not reply.rr:
+        return None
+    return min(rr.ttl for rr in reply.rr), False
+
+
+def generic_policy(answer: bytes) -> tuple[int, bool] | None:
+    analysis = analyze_answer(answer)
+    if analysis is None:
+        return None
+    _, ttl, negative = analysis
+    return ttl, negative
+
+
+def make_workload(args) -> list[bytes]:
+    rng = random.Random(args.seed)
+    names = [f"{'nx' if rng.random() < args.nx else ''}host{i}.example.com" for i in range(args.names)]
+    weights = list(accumulate(1 / rank ** args.zipf for rank in range(1, args.names + 1)))
+    types, type_weights = zip(*QTYPE_MIX)
+    type_weights = list(accumulate(type_weights))
+    return [
+        bytes(DNSRecord.question(name, q_type).pack())
+        for name, q_type in zip(
+            rng.choices(names, cum_weights=weights, k=args.queries),
+            rng.choices(types, cum_weights=type_weights, k=args.queries)
+        )
+    ]
+
+
+def replay(workload: list[bytes], forwarder: FakeForwarder, policy, rate: float, max_entries: int) -> dict[str, int]:
+    cache = CacheStore(max_entries)
+    upstream = negative = 0
+    # a virtual clock: the replay runs as fast as it can but TTLs see the target query rate
+    for i, req_bytes in enumerate(workload):
+        now = int(i / rate)
+        cache.expire(now, 64)
+        name, q_type, q_class, _ = read_question(req_bytes)
+        key = CacheKey(name.lower(), q_type, q_class)
+        if cache.lookup(key, now) is not None:
+            continue
+
+        upstream += 1
+        answer = forwarder.answer(req_bytes)
+        cacheable = policy(answer)
+        if cacheable is not None:
+            ttl, is_negative = cacheable
+            negative += is_negative
+            cache[key] = CacheValue(now + ttl, answer, (), ttl, is_negative)
+    return cache.stats() | {"upstream": upstream, "negative_cached": negative}
+
+
+def main() -> None:
+    arg_parser = ArgumentParser(description="Cache hit rate of a replayed query mix: A/NS/PTR-only vs all types")
+    arg_parser.add_argument("-q", "--queries", type=int, default=200000)
+    arg_parser.add_argument("-n", "--names", type=int, default=20000)
+    arg_parser.add_argument("--zipf", type=float, default=1.1)
+    arg_parser.add_argument("--nx", type=float, default=0.1, help="fraction of names that do not exist")
+    arg_parser.add_argument("--rate", type=float, default=500, help="queries per virtual second")
+    arg_parser.add_argument("--ttl", type=int, default=300)
+    arg_parser.add_argument("--max-entries", type=int, default=100000)
+    arg_parser.add_argument("--seed", type=int, default=1)
+    args = arg_parser.parse_args()
+
+    workload = make_workload(args)
+    forwarder = FakeForwarder(ttl=args.ttl)
+    print(f"{'policy':>8} {'hit rate':>9} {'upstream':>9} {'negative':>9}")
+    try:
+        for title, policy in (("legacy", legacy_policy), ("generic", generic_policy)):
+            stats = replay(workload, forwarder, policy, args.rate, args.max_entries)
+            hit_rate = stats["hits"] / len(workload)
+            print(f"{title:>8} {hit_rate:>9.1%} {stats['upstream']:>9} {stats['negative_cached']:>9}")
+    finally:
+        forwarder.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import json
+import os
+import random
+import selectors
+import socket
+import tempfile
+import time
+import urllib.request
+from argparse import ArgumentParser
+from itertools import accumulate
+
+from dnslib import DNSRecord
+
+from .fakeForwarder import FakeForwarder
+from .workersBench import free_udp_port, start_server, stop_server, warm_up, write_config
+
+
+def free_tcp_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def zipf_queries(names: int, exponent: float, count: int, seed: int) -> list[bytes]:
+    rng = random.Random(seed)
+    weights = list(accumulate(1 / rank ** exponent for rank in range(1, names + 1)))
+    ranks = rng.choices(range(names), cum_weights=weights, k=count)
+    packed = dict()
+    return [packed.setdefault(rank, bytes(DNSRecord.question(f"host{rank}.bench.test").pack())) for rank in ranks]
+
+
+def log_queries(file_name: str, count: int) -> list[bytes]:
+    # one query per line: "name [type]", blank lines and lines starting with # are skipped
+    queries = list()
+    with open(file_name) as log:
+        for line in log:
+            fields = line.split()
+            if not fields or fields[0].startswith("#"):
+                continue
+            queries.append(bytes(DNSRecord.question(fields[0], fields[1].upper() if len(fields) > 1 else "A").pack()))
+    if not queries:
+        raise ValueError(f"no queries in {file_name}")
+    return [queries[i % len(queries)] for i in range(count)]
+
+
+def replay(
+        address: tuple[str, int],
+        queries: list[bytes],
+        rate: float,
+        timeout: float = 1.0
+) -> tuple[int, list[float]]:
+    # Open loop: query i is due at start + i / rate whether or not earlier ones were answered,
+    # and latency counts from that due time, so a stalled server cannot hide its queue.
+    sent: dict[int, float] = dict()
+    latencies = list()
+    interval = 1 / rate
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock, selectors.DefaultSelector() as selector:
+        sock.setblocking(False)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+        selector.register(sock, selectors.EVENT_READ)
+        started = time.perf_counter()
+        end = started + len(queries) * interval + timeout
+        i = 0
+        while True:
+            now = time.perf_counter()
+            while i < len(queries) and started + i * interval <= now:
+                txid = i & 0xFFFF
+                sent[txid] = started + i * interval
+                try:
+                    sock.sendto(txid.to_bytes(2, "big") + queries[i][2:], address)
+                except (BlockingIOError, ConnectionRefusedError):
+                    pass
+                i += 1
+            if i == len(queries) and (not sent or now >= end):
+                break
+
+            wait = started + i * interval - now if i < len(queries) else end - now
+            if not selector.select(max(wait, 0)):
+                continue
+            while True:
+                try:
+                    data = sock.recv(65535)
+                except (BlockingIOError, ConnectionRefusedError):
+                    break
+                due = sent.pop(int.from_bytes(data[:2], "big"), None)
+                if due is not None:
+                    latencies.append(time.perf_counter() - due)
+    return len(queries), latencies
+
+
+def server_stats(port: int) -> dict:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/stats", timeout=2) as response:
+        return json.loads(response.read())
+
+
+def peak_rss(pid: int) -> int:
+    # VmHWM of the server and its workers, in bytes; 0 where /proc is not available
+    pids = [pid]
+    try:
+        for entry in os.listdir("/proc"):
+            if entry.isdigit() and entry != str(pid):
+                with open(f"/proc/{entry}/stat") as stat:
+                    if stat.read().rsplit(")", 1)[1].split()[1] == str(pid):
+                        pids.append(int(entry))
+    except OSError:
+        return 0
+
+    total = 0
+    for process in pids:
+        try:
+            with open(f"/proc/{process}/status") as status:
+                for line in status:
+                    if line.startswith("VmHWM:"):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)] if ordered else float("nan")
+
+
+def run(mode: str, workers: int, queries: list[bytes], args) -> dict:
+    forwarder = FakeForwarder(delay=args.delay, loss=args.loss, ttl=args.ttl, seed=args.seed).start()
+    server_address = ("127.0.0.1", free_udp_port())
+    metrics_port = free_tcp_port()
+    with tempfile.TemporaryDirectory() as directory:
+        write_config(directory, server_address, forwarder.address, metrics_port)
+        process = start_server(directory, ["--workers", str(workers), "--mode", mode])
+        try:
+            warm_up(server_address, ["warmup.bench.test"])
+            started = time.perf_counter()
+            sent, latencies = replay(server_address, queries, args.rate)
+            elapsed = time.perf_counter() - started
+            stats = server_stats(metrics_port)
+            rss = peak_rss(process.pid)
+        finally:
+            stop_server(process)
+            forwarder.stop()
+
+    latencies.sort()
+    lookups = stats["hits"] + stats["misses"]
+    return {
+        "mode": mode,
+        "workers": workers,
+        "sent": sent,
+        "answered": len(latencies),
+        "qps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "p999_ms": percentile(latencies, 0.999) * 1000,
+        "hit_ratio": stats["hits"] / lookups if lookups else 0.0,
+        "upstream_queries": forwarder.queries,
+        "peak_rss_mb": rss / 2 ** 20
+    }
+
+
+def main() -> None:
+    arg_parser = ArgumentParser(description="Replay a Zipf name set or a query log against DNSServer at a target rate")
+    arg_parser.add_argument("--modes", nargs="+", choices=("sync", "async"), default=["sync", "async"])
+    arg_parser.add_argument("--workers", type=int, default=1)
+    arg_parser.add_argument("--rate", type=float, default=2000, help="target queries per second")
+    arg_parser.add_argument("--duration", type=float, default=10.0)
+    arg_parser.add_argument("--log", help="query log to replay instead of the Zipf name set")
+    arg_parser.add_argument("--names", type=int, default=10000)
+    arg_parser.add_argument("--zipf", type=float, default=1.1)
+    arg_parser.add_argument("--delay", type=float, default=0.005, help="forwarder delay, seconds")
+    arg_parser.add_argument("--loss", type=float, default=0.0, help="fraction of forwarder queries dropped")
+    arg_parser.add_argument("--ttl", type=int, default=300)
+    arg_parser.add_argument("--seed", type=int, default=1)
+    arg_parser.add_argument("--json", action="store_true", help="print one JSON object per run")
+    args = arg_parser.parse_args()
+
+    count = int(args.rate * args.duration)
+    if args.log:
+        queries = log_queries(args.log, count)
+    else:
+        queries = zipf_queries(args.names, args.zipf, count, args.seed)
+
+    if not args.json:
+        print(f"{'mode':>5} {'workers':>7} {'qps':>8} {'answered':>9} {'p50 ms':>7} {'p99 ms':>7} "
+              f"{'p999 ms':>8} {'hit ratio':>9} {'upstream':>8} {'rss MB':>7}")
+    for mode in args.modes:
+        result = run(mode, args.workers, queries, args)
+        if args.json:
+            print(json.dumps(result | {"rate": args.rate, "seed": args.seed}))
+            continue
+        print(f"{result['mode']:>5} {result['workers']:>7} {result['qps']:>8.0f} "
+              f"{result['answered'] / result['sent']:>9.1%} {result['p50_ms']:>7.2f} {result['p99_ms']:>7.2f} "
+              f"{result['p999_ms']:>8.2f} {result['hit_ratio']:>9.1%} {result['upstream_queries']:>8} "
+              f"{result['peak_rss_mb']:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import time
+import timeit
+from argparse import ArgumentParser
+
+from dnslib import A, DNSLabel, DNSRecord, NS, PTR, QTYPE, RR
+
+from domain.dnsStuff import CacheKey, CacheValue
+from domain.wire import patch_answer, read_question, ttl_offsets
+
+NSA_QTYPE = -1
+# the legacy cache kept parsed RR lists per (name, type), with NS glue under NSA_QTYPE
+LegacyCache = dict[tuple[DNSLabel, int], tuple[int, list[RR]]]
+
+
+def make_cache(name: str, q_type: int) -> tuple[bytes, LegacyCache, dict[CacheKey, CacheValue]]:
+    request = DNSRecord.question(name, QTYPE.get(q_type))
+    reply = request.reply()
+    if q_type == QTYPE.A:
+        reply.add_answer(RR(name, QTYPE.A, rdata=A("93.184.216.34"), ttl=300))
+        reply.add_answer(RR(name, QTYPE.A, rdata=A("93.184.216.35"), ttl=300))
+    if q_type in (QTYPE.A, QTYPE.NS):
+        for i in range(2):
+            ns = RR(name, QTYPE.NS, rdata=NS(f"ns{i}.example.com"), ttl=300)
+            reply.add_answer(ns) if q_type == QTYPE.NS else reply.add_auth(ns)
+            reply.add_ar(RR(f"ns{i}.example.com", QTYPE.A, rdata=A(f"192.0.2.{i + 1}"), ttl=300))
+    if q_type == QTYPE.PTR:
+        reply.add_answer(RR(name, QTYPE.PTR, rdata=PTR("host.example.com"), ttl=300))
+
+    wire = bytes(reply.pack())
+    expiry = int(time.time()) + 300
+    label = DNSLabel(name)
+    legacy = {(label, q_type): (expiry, reply.rr)}
+    if q_type == QTYPE.A:
+        legacy[(label, QTYPE.NS)] = (expiry, reply.auth)
+    if q_type in (QTYPE.A, QTYPE.NS):
+        legacy[(label, NSA_QTYPE)] = (expiry, reply.ar)
+    cache = {CacheKey.from_label(label, q_type): CacheValue(expiry, wire, ttl_offsets(wire), 300)}
+    return bytes(request.pack()), legacy, cache
+
+
+def rebuild_answer(req_bytes: bytes, cache: LegacyCache) -> bytes:
+    # the old DNSServer.__from_cache path this benchmark compares against
+    client_data = DNSRecord.parse(req_bytes)
+    query = client_data.reply()
+
+    def add(section, value: tuple[int, list[RR]]) -> None:
+        expiry_time, data = value
+        for record in data:
+            section(RR(
+                rname=record.rname,
+                rclass=record.rclass,
+                rtype=record.rtype,
+                ttl=int(expiry_time - time.time()),
+                rdata=record.rdata
+            ))
+
+    match client_data.q.qtype:
+        case QTYPE.A:
+            add(query.add_answer, cache[(client_data.q.qname, QTYPE.A)])
+            add(query.add_auth, cache[(client_data.q.qname, QTYPE.NS)])
+            add(query.add_ar, cache[(client_data.q.qname, NSA_QTYPE)])
+        case QTYPE.PTR:
+            add(query.add_answer, cache[(client_data.q.qname, QTYPE.PTR)])
+        case QTYPE.NS:
+            add(query.add_answer, cache[(client_data.q.qname, QTYPE.NS)])
+            add(query.add_ar, cache[(client_data.q.qname, NSA_QTYPE)])
+    return query.pack()
+
+
+def patch_from_wire(req_bytes: bytes, cache: dict[CacheKey, CacheValue]) -> bytes:
+    name, q_type, q_class, question_end = read_question(req_bytes)
+    value = cache[CacheKey(name.lower(), q_type, q_class)]
+    return patch_answer(value.wire, value.ttl_offsets, req_bytes, question_end, value.expiry_time - int(time.time()))
+
+
+def main() -> None:
+    arg_parser = ArgumentParser(description="Cache hit cost: rebuilding RR objects vs patching cached wire bytes")
+    arg_parser.add_argument("-n", "--number", type=int, default=20000)
+    args = arg_parser.parse_args()
+
+    cases = (
+        ("A", "example.com", QTYPE.A),
+        ("NS", "example.com", QTYPE.NS),
+        ("PTR", "34.216.184.93.in-addr.arpa", QTYPE.PTR),
+    )
+    print(f"{'type':>4} {'rebuild us':>11} {'patch us':>9} {'speedup':>8}")
+    for title, name, q_type in cases:
+        req_bytes, legacy, cache = make_cache(name, q_type)
+        assert DNSRecord.parse(rebuild_answer(req_bytes, legacy)).rr == DNSRecord.parse(patch_from_wire(req_bytes, cache)).rr
+        rebuild = timeit.timeit(lambda: rebuild_answer(req_bytes, legacy), number=args.number) / args.number * 1e6
+        patch = timeit.timeit(lambda: patch_from_wire(req_bytes, cache), number=args.number) / args.number * 1e6
+        print(f"{title:>4} {rebuild:>11.2f} {patch:>9.2f} {rebuild / patch:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from os import path
+
+from dnslib import DNSRecord
+
+from .fakeForwarder import FakeForwarder
+
+SERVER_SCRIPT = path.join(path.dirname(path.dirname(path.abspath(__file__))), "dnsCacheServer.py")
+
+
+def free_udp_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def write_config(
+        directory: str,
+        server: tuple[str, int],
+        forwarder: tuple[str, int],
+        metrics_port: int = 0
+) -> None:
+    with open(path.join(directory, "config.ini"), "w") as config_file:
+        config_file.write(
+            f"[CacheServer]\nhost = {server[0]}\nport = {server[1]}\n\n"
+            f"[Forwarder]\nhost = {forwarder[0]}\nport = {forwarder[1]}\n\n"
+            f"[Metrics]\nport = {metrics_port}\n"
+        )
+
+
+def start_server(directory: str, extra_args: list[str]) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, SERVER_SCRIPT, *extra_args],
+        cwd=directory,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def warm_up(address: tuple[str, int], names: list[str], timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(0.5)
+        for name in names:
+            while True:
+                if time.monotonic() > deadline:
+                    raise TimeoutError("server did not answer during warm up")
+                sock.sendto(DNSRecord.question(name).pack(), address)
+                try:
+                    sock.recv(65535)
+                    break
+                except (socket.timeout, ConnectionRefusedError):
+                    continue
+
+
+def load_client(address: tuple[str, int], names: list[str], duration: float, window: int, seed: int) -> int:
+    rnd = random.Random(seed)
+    queries = [DNSRecord.question(name).pack() for name in names]
+    answered = 0
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(0.2)
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            for _ in range(window):
+                sock.sendto(rnd.choice(queries), address)
+            for _ in range(window):
+                try:
+                    sock.recv(65535)
+                    answered += 1
+                except socket.timeout:
+                    break
+    return answered
+
+
+def measure(workers: int, mode: str, names: list[str], clients: int, duration: float, window: int) -> float:
+    forwarder = FakeForwarder().start()
+    server_address = ("127.0.0.1", free_udp_port())
+    with tempfile.TemporaryDirectory() as directory:
+        write_config(directory, server_address, forwarder.address)
+        process = start_server(directory, ["--workers", str(workers), "--mode", mode])
+        try:
+            warm_up(server_address, names)
+            with multiprocessing.Pool(clients) as pool:
+                started = time.monotonic()
+                answered = pool.starmap(
+                    load_client,
+                    [(server_address, names, duration, window, seed) for seed in range(clients)]
+                )
+                elapsed = time.monotonic() - started
+        finally:
+            stop_server(process)
+            forwarder.stop()
+    return sum(answered) / elapsed
+
+
+def main() -> None:
+    arg_parser = ArgumentParser(description="QPS scaling of the cache-hit path from 1 to N workers on loopback")
+    arg_parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    arg_parser.add_argument("--mode", choices=("sync", "async"), default="sync")
+    arg_parser.add_argument("--clients", type=int, default=os.cpu_count())
+    arg_parser.add_argument("--names", type=int, default=1000)
+    arg_parser.add_argument("--duration", type=float, default=5.0)
+    arg_parser.add_argument("--window", type=int, default=16)
+    args = arg_parser.parse_args()
+
+    names = [f"host{i}.bench.test" for i in range(args.names)]
+    baseline = None
+    print(f"{'workers':>7} {'qps':>10} {'speedup':>8}")
+    # 0 is the server without the pool, for reference; the speedup is counted from one pooled worker
+    print(f"{0:>7} {measure(0, args.mode, names, args.clients, args.duration, args.window):>10.0f}")
+    for workers in range(1, args.max_workers + 1):
+        qps = measure(workers, args.mode, names, args.clients, args.duration, args.window)
+        baseline = baseline or qps
+        print(f"{workers:>7} {qps:>10.0f} {qps / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
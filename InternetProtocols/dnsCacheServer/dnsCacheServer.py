@@ -1,10 +1,20 @@
 from domain.dnsServer import DNSServer
+from domain.workerPool import WorkerPool
 from argparse import ArgumentParser
 
 
 def config_argparse(arg_parser: ArgumentParser) -> None:
     arg_parser.add_argument("-d", "--debug", action="store_true",
                             dest="debug", help="При указании запускает в debug режиме")
+    arg_parser.add_argument("-m", "--mode", choices=("sync", "async"), default="sync",
+                            dest="mode", help="Режим обслуживания запросов: sync - последовательный, "
+                                              "async - на asyncio, промахи кэша ждут форвардер параллельно")
+    arg_parser.add_argument("-w", "--workers", type=int, default=0,
+                            dest="workers", help="Количество процессов-воркеров на общем порту (SO_REUSEPORT) "
+                                                 "с общим кэшем; 0 - обслуживать запросы в основном процессе")
+    arg_parser.add_argument("-t", "--takeover", action="store_true",
+                            dest="takeover", help="Перехватить сокет и кэш у запущенного сервера через "
+                                                  "handoff_socket из конфига, без простоя")
 
 
 def main():
@@ -12,14 +22,28 @@ def main():
     config_argparse(arg_parser)
     args = arg_parser.parse_args()
 
-    server = DNSServer(debug=args.debug)
+    if args.takeover and args.workers > 0:
+        arg_parser.error("--takeover работает только с одним процессом")
+
+    server = DNSServer(debug=args.debug, takeover=args.takeover)
     try:
-        server.start()
+        if args.workers > 0:
+            server.install_signal_handlers()
+            server.serve_metrics()
+            WorkerPool(args.workers, args.debug, args.mode).run(server.cache, server.maintain)
+        elif args.mode == "async":
+            server.start_async()
+        else:
+            server.start()
     except KeyboardInterrupt:
         print("\nsaving cache...")
         server.save_cache()
         print("cache has been saved.")
+        print("cache stats: " + ", ".join(f"{name}={value}" for name, value in server.stats().items()))
 
+    if server.handed_over:
+        # the new server owns the socket, the cache and the snapshot file now
+        return
     input("\nPress Enter for exit...")
 
 
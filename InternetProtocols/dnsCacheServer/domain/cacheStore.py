@@ -0,0 +1,246 @@
+import heapq
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from itertools import count
+from typing import Hashable, ItemsView, Iterator, MutableMapping
+
+from .dnsStuff import CacheKey, CacheValue
+
+
+class EvictionPolicy(ABC):
+    @abstractmethod
+    def insert(self, key: Hashable) -> None:
+        pass
+
+    @abstractmethod
+    def touch(self, key: Hashable) -> None:
+        pass
+
+    @abstractmethod
+    def remove(self, key: Hashable) -> None:
+        pass
+
+    @abstractmethod
+    def victim(self) -> Hashable:
+        pass
+
+
+class LRUPolicy(EvictionPolicy):
+    def __init__(self):
+        self._order: OrderedDict[Hashable, None] = OrderedDict()
+
+    def insert(self, key: Hashable) -> None:
+        self._order[key] = None
+
+    def touch(self, key: Hashable) -> None:
+        self._order.move_to_end(key)
+
+    def remove(self, key: Hashable) -> None:
+        del self._order[key]
+
+    def victim(self) -> Hashable:
+        return next(iter(self._order))
+
+
+class LFUPolicy(EvictionPolicy):
+    # O(1) LFU: keys are bucketed by use count, ties inside a bucket are broken by recency
+    def __init__(self):
+        self._frequency: dict[Hashable, int] = dict()
+        self._buckets: dict[int, OrderedDict[Hashable, None]] = dict()
+        self._min_frequency = 0
+
+    def insert(self, key: Hashable) -> None:
+        self._frequency[key] = 1
+        self._buckets.setdefault(1, OrderedDict())[key] = None
+        self._min_frequency = 1
+
+    def touch(self, key: Hashable) -> None:
+        frequency = self.__unlink(key)
+        if frequency == self._min_frequency and frequency not in self._buckets:
+            self._min_frequency = frequency + 1
+        self._frequency[key] = frequency + 1
+        self._buckets.setdefault(frequency + 1, OrderedDict())[key] = None
+
+    def remove(self, key: Hashable) -> None:
+        self.__unlink(key)
+        del self._frequency[key]
+
+    def victim(self) -> Hashable:
+        if self._min_frequency not in self._buckets:
+            self._min_frequency = min(self._buckets)
+        return next(iter(self._buckets[self._min_frequency]))
+
+    def __unlink(self, key: Hashable) -> int:
+        frequency = self._frequency[key]
+        bucket = self._buckets[frequency]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[frequency]
+        return frequency
+
+
+POLICIES: dict[str, type[EvictionPolicy]] = {
+    "lru": LRUPolicy,
+    "lfu": LFUPolicy,
+}
+
+
+class CacheStore(MutableMapping[CacheKey, CacheValue]):
+    def __init__(self, max_entries: int = 0, max_bytes: int = 0, policy: str = "lru", max_stale: int = 0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # expired entries are kept this many seconds longer, to be served stale if the forwarders fail
+        self.max_stale = max_stale
+        self.policy_name = policy
+        self.policy = POLICIES[policy]()
+        self.size_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self._entries: dict[CacheKey, CacheValue] = dict()
+        self._sizes: dict[CacheKey, int] = dict()
+        # (expiry_time + max_stale, sequence, key); entries that were replaced or removed are skipped lazily
+        self._expiry_heap: list[tuple[int, int, CacheKey]] = list()
+        self._sequence = count()
+
+    def lookup(self, key: CacheKey, now: int) -> CacheValue | None:
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        if value.expiry_time <= now:
+            self.misses += 1
+            if value.expiry_time + self.max_stale <= now:
+                self.expirations += 1
+                self.__remove(key)
+            return None
+
+        self.hits += 1
+        value.hits += 1
+        self.policy.touch(key)
+        return value
+
+    def lookup_stale(self, key: CacheKey, now: int) -> CacheValue | None:
+        value = self._entries.get(key)
+        if value is None or value.expiry_time + self.max_stale <= now:
+            return None
+        return value
+
+    def expire(self, now: int, limit: int | None = None) -> int:
+        heap = self._expiry_heap
+        popped = 0
+        while heap and heap[0][0] <= now and (limit is None or popped < limit):
+            removal_time, _, key = heapq.heappop(heap)
+            popped += 1
+            value = self._entries.get(key)
+            if value is not None and value.expiry_time + self.max_stale == removal_time:
+                self.expirations += 1
+                self.__remove(key)
+        return popped
+
+    def expire_within(self, now: int, seconds: float, batch: int = 64) -> int:
+        # batches until nothing is due or `seconds` are spent: a backlog is worked off as fast as
+        # the budget allows, and one call never holds the queries up for long
+        deadline = time.perf_counter() + seconds
+        popped = 0
+        while True:
+            done = self.expire(now, batch)
+            popped += done
+            if done < batch or time.perf_counter() >= deadline:
+                return popped
+
+    def clear_expired(self, now: int) -> None:
+        self.expire(now)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def reconfigure(self, max_entries: int, max_bytes: int, policy: str, max_stale: int) -> None:
+        if type(self.policy) is not POLICIES[policy]:
+            # the new policy starts from insertion order, use history is not transferable
+            self.policy = POLICIES[policy]()
+            for key in self._entries:
+                self.policy.insert(key)
+        self.policy_name = policy
+        if max_stale != self.max_stale:
+            self.max_stale = max_stale
+            self.__rebuild_heap()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        while self.__over_limit() and len(self._entries) > 1:
+            self.evictions += 1
+            self.__remove(self.policy.victim())
+
+    def items(self) -> ItemsView[CacheKey, CacheValue]:
+        # bypasses __getitem__, so iterating does not count as use for the eviction policy
+        return self._entries.items()
+
+    def __getitem__(self, key: CacheKey) -> CacheValue:
+        value = self._entries[key]
+        self.policy.touch(key)
+        return value
+
+    def __setitem__(self, key: CacheKey, value: CacheValue) -> None:
+        size = key.size() + value.size()
+        if key in self._entries:
+            self.size_bytes -= self._sizes[key]
+            self.policy.touch(key)
+        else:
+            self.policy.insert(key)
+        self._entries[key] = value
+        self._sizes[key] = size
+        self.size_bytes += size
+        self.__schedule(key, value)
+
+        while self.__over_limit() and len(self._entries) > 1:
+            self.evictions += 1
+            self.__remove(self.policy.victim())
+
+    def __delitem__(self, key: CacheKey) -> None:
+        if key not in self._entries:
+            raise KeyError(key)
+        self.__remove(key)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[CacheKey]:
+        return iter(self._entries)
+
+    def __over_limit(self) -> bool:
+        return (
+                (self.max_entries > 0 and len(self._entries) > self.max_entries) or
+                (self.max_bytes > 0 and self.size_bytes > self.max_bytes)
+        )
+
+    def __schedule(self, key: CacheKey, value: CacheValue) -> None:
+        heap = self._expiry_heap
+        heapq.heappush(heap, (value.expiry_time + self.max_stale, next(self._sequence), key))
+        if len(heap) > 2 * len(self._entries) + 1024:
+            self.__rebuild_heap()
+
+    def __rebuild_heap(self) -> None:
+        self._expiry_heap = [
+            (value.expiry_time + self.max_stale, next(self._sequence), key)
+            for key, value in self._entries.items()
+        ]
+        heapq.heapify(self._expiry_heap)
+
+    def __remove(self, key: CacheKey) -> None:
+        del self._entries[key]
+        self.size_bytes -= self._sizes.pop(key)
+        self.policy.remove(key)
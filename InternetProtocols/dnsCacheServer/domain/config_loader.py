@@ -13,12 +13,41 @@ class ConfigLoader:
                 self._config["CacheServer"]["host"],
                 int(self._config["CacheServer"]["port"])
             )
+            self.handoff_socket = self._config.get("CacheServer", "handoff_socket", fallback="")
             self.forwarder_server = (
                 self._config["Forwarder"]["host"],
                 int(self._config["Forwarder"]["port"])
             )
+            self.forwarder_servers = self.__parse_servers(
+                self._config.get("Forwarder", "servers", fallback=""),
+                self.forwarder_server
+            )
+            self.cache_max_entries = self._config.getint("Cache", "max_entries", fallback=100000)
+            self.cache_max_bytes = self._config.getint("Cache", "max_bytes", fallback=0)
+            self.cache_policy = self._config.get("Cache", "policy", fallback="lru").lower()
+            if self.cache_policy not in ("lru", "lfu"):
+                print("Ошибка в чтении конфига. policy может быть lru или lfu, используется lru")
+                self.cache_policy = "lru"
+            self.checkpoint_interval = self._config.getint("Cache", "checkpoint_interval", fallback=300)
+            self.prefetch_fraction = self._config.getfloat("Cache", "prefetch_fraction", fallback=0.1)
+            self.prefetch_min_hits = self._config.getint("Cache", "prefetch_min_hits", fallback=3)
+            self.serve_stale = self._config.getint("Cache", "serve_stale", fallback=0)
+            self.stale_answer_ttl = self._config.getint("Cache", "stale_answer_ttl", fallback=30)
+            self.metrics_server = (
+                self._config.get("Metrics", "host", fallback="127.0.0.1"),
+                self._config.getint("Metrics", "port", fallback=0)
+            )
+            self.log_rate = self._config.getint("Metrics", "log_rate", fallback=10)
         except ValueError:
-            print("Ошибка в чтении конфига. Проверьте, что port - это число")
+            print("Ошибка в чтении конфига. Проверьте, что числовые параметры заданы числами")
+
+    @staticmethod
+    def __parse_servers(servers: str, default: tuple[str, int]) -> list[tuple[str, int]]:
+        parsed = list()
+        for server in servers.replace(",", " ").split():
+            host, _, port = server.partition(":")
+            parsed.append((host, int(port) if port else 53))
+        return parsed or [default]
 
     def __load(self) -> None:
         self.__pre_load()
@@ -32,10 +61,26 @@ class ConfigLoader:
         self._config.add_section("CacheServer")
         self._config.set("CacheServer", "host", "127.0.0.1")
         self._config.set("CacheServer", "port", "53")
+        self._config.set("CacheServer", "handoff_socket", "")
 
         self._config.add_section("Forwarder")
         self._config.set("Forwarder", "host", "8.26.56.26")
         self._config.set("Forwarder", "port", "53")
 
+        self._config.add_section("Cache")
+        self._config.set("Cache", "max_entries", "100000")
+        self._config.set("Cache", "max_bytes", "0")
+        self._config.set("Cache", "policy", "lru")
+        self._config.set("Cache", "checkpoint_interval", "300")
+        self._config.set("Cache", "prefetch_fraction", "0.1")
+        self._config.set("Cache", "prefetch_min_hits", "3")
+        self._config.set("Cache", "serve_stale", "0")
+        self._config.set("Cache", "stale_answer_ttl", "30")
+
+        self._config.add_section("Metrics")
+        self._config.set("Metrics", "host", "127.0.0.1")
+        self._config.set("Metrics", "port", "0")
+        self._config.set("Metrics", "log_rate", "10")
+
         with open(self._path, "w") as config_file:
             self._config.write(config_file)
@@ -1,236 +1,481 @@
-import pickle
+import asyncio
+import signal
 import socket
+import struct
 import time
 
-from dnslib import DNSRecord, QTYPE, RR
+from dnslib import DNSError, DNSRecord
+from .cacheStore import CacheStore
 from .dnsStuff import CacheKey, CacheValue, ForwarderTimeout
 from .config_loader import ConfigLoader
+from .forwarder import ForwarderPool
+from .handoff import Handoff, HandoffError, HandoffListener
+from .log import RateLimitedLog
+from .metrics import Metrics, MetricsServer
+from .protocols import ServerProtocol
+from .sharedCache import SharedCache
+from .snapshot import Checkpointer, SnapshotError, parse_snapshot, read_snapshot, write_snapshot
+from .wire import adopt_answer, analyze_answer, patch_answer, read_question
 
 
 class DNSServer:
-    NSA_QTYPE = -1
+    FORWARDER_TIMEOUT = 1
+    MAX_TTL = 86400
+    # RFC 2308 recommends keeping negative answers for no more than one to three hours
+    MAX_NEGATIVE_TTL = 10800
+    TICK = 0.1
+    # seconds of every tick that may go to expiry
+    EXPIRE_BUDGET = 0.002
 
-    def __init__(self, debug: bool = False):
+    def __init__(
+            self,
+            debug: bool = False,
+            cache: CacheStore | SharedCache | None = None,
+            reuse_port: bool = False,
+            metrics_offset: int = 0,
+            takeover: bool = False
+    ):
         self._debug = debug
+        self._reuse_port = reuse_port
         self.cache_file_name = "dnsCache"
+        self.metrics = Metrics()
+        self.handed_over = False
+        self._reload_requested = False
 
         cfg_loader = ConfigLoader()
         self.cache_server = cfg_loader.cache_server
-        self.forwarder_server = cfg_loader.forwarder_server
+        self.handoff_socket = cfg_loader.handoff_socket
+        self._handoff: Handoff | None = None
+        self._successor: HandoffListener | None = None
+        self._took_over = False
+        if takeover:
+            try:
+                self._handoff = Handoff(self.handoff_socket)
+            except HandoffError as err:
+                print(f"Работа не перехвачена, обычный запуск: {err}")
+        self.forwarders = ForwarderPool(
+            cfg_loader.forwarder_servers,
+            self.FORWARDER_TIMEOUT,
+            self.metrics.forwarder_rtt_seconds.observe
+        )
+        self.log = RateLimitedLog(cfg_loader.log_rate)
+        # workers of one pool listen on consecutive stats ports, 0 turns the endpoint off
+        host, port = cfg_loader.metrics_server
+        self.metrics_server = (host, port + metrics_offset if port else 0)
+        self._metrics_server: MetricsServer | None = None
+        self.prefetch_fraction = cfg_loader.prefetch_fraction
+        self.prefetch_min_hits = cfg_loader.prefetch_min_hits
+        self.serve_stale = cfg_loader.serve_stale
+        self.stale_answer_ttl = cfg_loader.stale_answer_ttl
 
-        try:
-            with open(self.cache_file_name, "rb") as file:
-                self.cache: dict[CacheKey, CacheValue] = pickle.load(file)
+        if cache is None:
+            self.cache = CacheStore(
+                cfg_loader.cache_max_entries,
+                cfg_loader.cache_max_bytes,
+                cfg_loader.cache_policy,
+                cfg_loader.serve_stale
+            )
+            if self._handoff is not None:
+                self.__receive_cache(cfg_loader.serve_stale)
+            else:
+                self.__load_cache(cfg_loader.serve_stale)
+            self._checkpointer = Checkpointer(
+                self.cache_file_name,
+                cfg_loader.checkpoint_interval,
+                cfg_loader.serve_stale
+            )
+        else:
+            self.cache = cache
+            self._checkpointer = None
 
-            self.clear_expired()
+        self._tasks: set[asyncio.Task] = set()
+        self._in_flight: dict[CacheKey, asyncio.Future] = dict()
+        self._prefetch_queue: list[tuple[CacheKey, bytes]] = list()
+        # expiry time of the entry each prefetch was started for, so it is started only once
+        self._prefetched: dict[CacheKey, int] = dict()
+        self.saved_upstream_queries = 0
+
+        print("\n----Ready for work-----\n")
+
+    def __load_cache(self, max_stale: int) -> None:
+        try:
+            for key, value in read_snapshot(self.cache_file_name, int(time.time()), max_stale):
+                self.cache[key] = value
             if len(self.cache) != 0:
-                print(
-                    "-----Load from disk:-----\n" +
-                    "\n".join((str(key) + " --- " + str(self.cache[key]) for key in self.cache)) +
-                    "\n"
-                )
+                print(f"-----Load from disk: {len(self.cache)} records-----")
         except IOError:
-            self.cache: dict[CacheKey, CacheValue] = dict()
+            pass
+        except (SnapshotError, ValueError, IndexError, struct.error) as err:
+            print(f"Файл кэша не прочитан и будет перезаписан: {err}")
 
-        print("\n----Ready for work-----\n")
+    def __receive_cache(self, max_stale: int) -> None:
+        try:
+            for key, value in parse_snapshot(self._handoff.receive_cache(), int(time.time()), max_stale):
+                self.cache[key] = value
+            print(f"-----Received from the old server: {len(self.cache)} records-----")
+        except (OSError, SnapshotError, ValueError, IndexError, struct.error) as err:
+            print(f"Кэш старого сервера не получен: {err}")
+
+    def reload_config(self) -> None:
+        cfg_loader = ConfigLoader()
+        try:
+            if cfg_loader.cache_server != self.cache_server:
+                print("Адрес сервера меняется только перезапуском")
+            if cfg_loader.forwarder_servers != [forwarder.address for forwarder in self.forwarders.forwarders]:
+                old_forwarders = self.forwarders
+                self.forwarders = ForwarderPool(
+                    cfg_loader.forwarder_servers,
+                    self.FORWARDER_TIMEOUT,
+                    self.metrics.forwarder_rtt_seconds.observe
+                )
+                old_forwarders.close()
+            self.log.rate = cfg_loader.log_rate
+            self.prefetch_fraction = cfg_loader.prefetch_fraction
+            self.prefetch_min_hits = cfg_loader.prefetch_min_hits
+            self.serve_stale = cfg_loader.serve_stale
+            self.stale_answer_ttl = cfg_loader.stale_answer_ttl
+            if isinstance(self.cache, (CacheStore, SharedCache)):
+                self.cache.reconfigure(
+                    cfg_loader.cache_max_entries,
+                    cfg_loader.cache_max_bytes,
+                    cfg_loader.cache_policy,
+                    cfg_loader.serve_stale
+                )
+            if self._checkpointer is not None:
+                self._checkpointer.interval = cfg_loader.checkpoint_interval
+                self._checkpointer.max_stale = cfg_loader.serve_stale
+            if self._successor is not None:
+                self._successor.max_stale = cfg_loader.serve_stale
+        except AttributeError:
+            # ConfigLoader has already reported what is wrong, the old settings stay
+            return
+        print("-----Config reloaded-----")
+
+    def install_signal_handlers(self) -> None:
+        # SIGHUP only raises a flag, the reload itself runs on the next tick
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, lambda signum, frame: setattr(self, "_reload_requested", True))
 
     def clear_expired(self) -> None:
-        to_remove = list()
+        self.cache.clear_expired(int(time.time()))
 
-        for key in self.cache:
-            if self.cache[key].expiry_time < int(time.time()):
-                to_remove.append(key)
+    def serve_metrics(self, report_errors: bool = True) -> None:
+        if self.metrics_server[1] == 0 or self._metrics_server is not None:
+            return
+        try:
+            self._metrics_server = MetricsServer(self.metrics_server, self.stats, self.metrics.histograms).start()
+        except OSError as err:
+            if report_errors:
+                print(f"Порт статистики {self.metrics_server[0]}:{self.metrics_server[1]} не открыт: {err}")
 
-        for key in to_remove:
-            del self.cache[key]
+    def __bind(self) -> socket.socket:
+        if self._handoff is not None:
+            return self._handoff.socket
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if self._reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(self.cache_server)
+        return sock
+
+    def __on_bound(self) -> None:
+        if self._handoff is not None:
+            # the old server stops once this is sent, until then both answer from the same socket
+            self._handoff.ready()
+            self._handoff = None
+            self._took_over = True
+        if self.handoff_socket and not self._reuse_port and isinstance(self.cache, CacheStore):
+            try:
+                self._successor = HandoffListener(self.handoff_socket, self.serve_stale)
+            except OSError as err:
+                print(f"Сокет передачи работы {self.handoff_socket} не открыт: {err}")
+
+    def __close_successor(self) -> None:
+        if self._successor is not None:
+            self._successor.close(self.handed_over)
+            self._successor = None
 
     def start(self) -> None:
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            sock.bind(self.cache_server)
-            sock.settimeout(2)
+        self.install_signal_handlers()
+        self.serve_metrics(report_errors=self._handoff is None)
+        with self.__bind() as sock:
+            self.__on_bound()
+            sock.settimeout(self.TICK)
+            try:
+                self.__serve(sock)
+            finally:
+                self.__close_successor()
+
+    def __serve(self, sock: socket.socket) -> None:
+        while True:
+            try:
+                req_bytes, addr = sock.recvfrom(1024)
+                answer = self.__make_answer(req_bytes)
+                if answer is not None:
+                    sock.sendto(answer, addr)
+                self.__run_prefetch()
+            except socket.timeout:
+                pass
+            except Exception as err:
+                self.metrics.errors += 1
+                self.log(err)
+            if self.__tick(sock):
+                return
+
+    def start_async(self) -> None:
+        asyncio.run(self.__serve_async())
+
+    async def __serve_async(self) -> None:
+        self.install_signal_handlers()
+        self.serve_metrics(report_errors=self._handoff is None)
+        loop = asyncio.get_running_loop()
+        sock = self.__bind()
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: ServerProtocol(self.__on_request, self.log, self.metrics),
+            sock=sock
+        )
+        self.__on_bound()
+        try:
             while True:
-                try:
-                    req_bytes, addr = sock.recvfrom(1024)
-                    sock.sendto(self.__make_answer(req_bytes), addr)
-                except socket.timeout:
-                    continue
-                except Exception as err:
-                    print(err)
-                    continue
-
-    def __make_answer(self, req_bytes) -> bytes:
-        client_data = DNSRecord.parse(req_bytes)
-        key = CacheKey(client_data.q.qname, client_data.q.qtype)
+                await asyncio.sleep(self.TICK)
+                if self.__tick(sock):
+                    break
+            # queries already waiting for a forwarder are still answered, the socket is shared
+            if self._tasks:
+                await asyncio.wait(self._tasks, timeout=self.FORWARDER_TIMEOUT)
+        finally:
+            transport.close()
+            self.__close_successor()
+
+    def __tick(self, sock: socket.socket) -> bool:
+        self.cache.expire_within(int(time.time()), self.EXPIRE_BUDGET)
+        self.maintain()
+        if self._successor is not None and self._successor.poll(sock, self.cache.items()):
+            print("-----Handed over to the new server-----")
+            self.handed_over = True
+            if self._checkpointer is not None:
+                self._checkpointer.wait()
+        return self.handed_over
+
+    def maintain(self) -> None:
+        # periodic work besides expiry, the pool owner runs it from the CacheKeeper loop
+        if self._reload_requested:
+            self._reload_requested = False
+            self.reload_config()
+        if self._took_over:
+            # the old server holds the stats port until it exits
+            self.serve_metrics(report_errors=False)
+        self.checkpoint()
+
+    def checkpoint(self) -> None:
+        if self._checkpointer is not None:
+            self._checkpointer.tick(self.cache.items())
+
+    def __on_request(self, transport: asyncio.DatagramTransport, req_bytes: bytes, addr: tuple) -> None:
+        started = time.perf_counter()
+        self.metrics.queries += 1
+        try:
+            answer = self.__from_cache(req_bytes)
+            if answer is not None:
+                transport.sendto(answer, addr)
+                self.metrics.cache_answer_seconds.observe(time.perf_counter() - started)
+                self.__run_prefetch_async()
+                return
+
+            client_data = self.__parse(req_bytes)
+        except Exception as err:
+            self.metrics.errors += 1
+            self.log(err)
+            return
+        if client_data is None:
+            return
+
+        if self._debug:
+            self.log("from server\n" + f"type: {client_data.q.qtype}")
+        task = asyncio.create_task(self.__answer_async(transport, client_data, req_bytes, addr, started))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
 
+    async def __answer_async(
+            self,
+            transport: asyncio.DatagramTransport,
+            client_data: DNSRecord,
+            req_bytes: bytes,
+            addr: tuple,
+            started: float
+    ) -> None:
+        try:
+            try:
+                key = CacheKey.from_label(client_data.q.qname, client_data.q.qtype, client_data.q.qclass)
+                answer = adopt_answer(await self.__ask_once(key, req_bytes), req_bytes)
+                self.metrics.forwarder_answers += 1
+            except ForwarderTimeout:
+                self.metrics.forwarder_timeouts += 1
+                answer = self.__fallback_answer(client_data, req_bytes)
+            transport.sendto(answer, addr)
+            self.metrics.forwarder_answer_seconds.observe(time.perf_counter() - started)
+        except Exception as err:
+            self.metrics.errors += 1
+            self.log(err)
+
+    def __ask_once(self, key: CacheKey, req_bytes: bytes) -> asyncio.Future:
+        # single flight: concurrent misses for one key share a single upstream query
+        flight = self._in_flight.get(key)
+        if flight is not None:
+            self.saved_upstream_queries += 1
+            return asyncio.shield(flight)
+
+        flight = asyncio.ensure_future(self.__ask_and_cache_async(req_bytes))
+        self._in_flight[key] = flight
+        flight.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return asyncio.shield(flight)
+
+    async def __ask_and_cache_async(self, req_bytes: bytes) -> bytes:
+        answer = await self.forwarders.ask_async(req_bytes)
+        self.__caching(answer)
+        return answer
+
+    def __make_answer(self, req_bytes) -> bytes | None:
+        started = time.perf_counter()
+        self.metrics.queries += 1
+        answer = self.__from_cache(req_bytes)
+        if answer is not None:
+            self.metrics.cache_answer_seconds.observe(time.perf_counter() - started)
+            return answer
+
+        client_data = self.__parse(req_bytes)
+        if client_data is None:
+            return None
+        if self._debug:
+            self.log("from server\n" + f"type: {client_data.q.qtype}")
+        try:
+            answer = self.__get_and_save_answer(req_bytes)
+            self.metrics.forwarder_answers += 1
+        except ForwarderTimeout:
+            self.metrics.forwarder_timeouts += 1
+            answer = self.__fallback_answer(client_data, req_bytes)
+        self.metrics.forwarder_answer_seconds.observe(time.perf_counter() - started)
+        return answer
+
+    def __parse(self, req_bytes: bytes) -> DNSRecord | None:
+        try:
+            return DNSRecord.parse(req_bytes)
+        except DNSError as err:
+            self.metrics.parse_errors += 1
+            self.log(f"bad request: {err}")
+            return None
+
+    def __from_cache(self, req_bytes: bytes) -> bytes | None:
+        try:
+            question = read_question(req_bytes)
+        except (IndexError, struct.error):
+            # malformed, __parse reports it
+            return None
+        if question is None:
+            return None
+
+        name, q_type, q_class, question_end = question
+        key = CacheKey(name.lower(), q_type, q_class)
+        now = int(time.time())
+        value = self.cache.lookup(key, now)
+        if value is None:
+            return None
+
+        self.metrics.cache_answers += 1
+        self.__maybe_prefetch(key, value, now, req_bytes)
+        answer = patch_answer(value.wire, value.ttl_offsets, req_bytes, question_end, value.expiry_time - now)
+        if self._debug:
+            self.log("from cache\n" + f"type: {q_type}")
+            self.debug_print(DNSRecord.parse(answer))
+        return answer
+
+    def __maybe_prefetch(self, key: CacheKey, value: CacheValue, now: int, req_bytes: bytes) -> None:
         if (
-                key in self.cache and
-                self.cache[key].expiry_time > int(time.time())
+                self.prefetch_min_hits <= 0 or
+                value.hits < self.prefetch_min_hits or
+                value.expiry_time - now > value.original_ttl * self.prefetch_fraction or
+                self._prefetched.get(key) == value.expiry_time
         ):
-            print("from cache\n" + f"type: {client_data.q.qtype}")
-            return self.__from_cache(client_data)
-        else:
-            print("from server\n" + f"type: {client_data.q.qtype}")
+            return
+        if len(self._prefetched) > 10000:
+            self._prefetched.clear()
+        self._prefetched[key] = value.expiry_time
+        self._prefetch_queue.append((key, req_bytes))
+
+    def __run_prefetch(self) -> None:
+        # sync mode: refresh only after the client that triggered it has been answered
+        while self._prefetch_queue:
+            _, req_bytes = self._prefetch_queue.pop()
             try:
-                return self.__get_and_save_answer(req_bytes)
+                self.__get_and_save_answer(req_bytes)
             except ForwarderTimeout:
-                return client_data.reply().pack()
+                pass
+
+    def __run_prefetch_async(self) -> None:
+        while self._prefetch_queue:
+            key, req_bytes = self._prefetch_queue.pop()
+            self.__ask_once(key, req_bytes).add_done_callback(self.__ignore_result)
+
+    @staticmethod
+    def __ignore_result(future: asyncio.Future) -> None:
+        if not future.cancelled():
+            future.exception()
+
+    def __stale_answer(self, req_bytes: bytes) -> bytes | None:
+        question = read_question(req_bytes)
+        if self.serve_stale <= 0 or question is None:
+            return None
+
+        name, q_type, q_class, question_end = question
+        value = self.cache.lookup_stale(CacheKey(name.lower(), q_type, q_class), int(time.time()))
+        if value is None:
+            return None
+        self.metrics.stale_answers += 1
+        if self._debug:
+            self.log("stale from cache\n" + f"type: {q_type}")
+        return patch_answer(value.wire, value.ttl_offsets, req_bytes, question_end, self.stale_answer_ttl)
+
+    def __fallback_answer(self, client_data: DNSRecord, req_bytes: bytes) -> bytes:
+        stale = self.__stale_answer(req_bytes)
+        if stale is not None:
+            return stale
+        self.metrics.failed_answers += 1
+        return client_data.reply().pack()
 
     def __get_and_save_answer(self, req_bytes: bytes) -> bytes:
-        ans = self.__ask_forwarder(req_bytes)
+        ans = self.forwarders.ask(req_bytes)
         self.__caching(ans)
         return ans
 
     def __caching(self, ans: bytes) -> None:
-        ans_data = DNSRecord.parse(ans)
-        match ans_data.q.qtype:
-            case QTYPE.A:
-                self.cache[CacheKey(ans_data.q.qname, QTYPE.A)] = CacheValue(
-                    int(time.time()) + ans_data.a.ttl,
-                    ans_data.rr,
-                    True
-                )
-                self.cache[CacheKey(ans_data.q.qname, QTYPE.NS)] = CacheValue(
-                    int(time.time()) + ans_data.a.ttl,
-                    ans_data.auth,
-                    False
-                )
-                self.cache[CacheKey(ans_data.q.qname, self.NSA_QTYPE)] = CacheValue(
-                    int(time.time()) + ans_data.a.ttl,
-                    ans_data.ar,
-                    False
-                )
-            case QTYPE.PTR:
-                if len(ans_data.auth) == 0:
-                    self.cache[CacheKey(ans_data.q.qname, QTYPE.PTR)] = CacheValue(
-                        int(time.time()) + ans_data.a.ttl,
-                        ans_data.rr,
-                        True
-                    )
-                else:
-                    self.cache[CacheKey(ans_data.q.qname, QTYPE.PTR)] = CacheValue(
-                        int(time.time()) + ans_data.auth[0].ttl,
-                        ans_data.auth,
-                        True
-                    )
-            case QTYPE.NS:
-                self.cache[CacheKey(ans_data.q.qname, QTYPE.NS)] = CacheValue(
-                    int(time.time()) + ans_data.a.ttl,
-                    ans_data.rr,
-                    True
-                )
-                self.cache[CacheKey(ans_data.q.qname, self.NSA_QTYPE)] = CacheValue(
-                    int(time.time()) + ans_data.a.ttl,
-                    ans_data.ar,
-                    False
-                )
+        question = read_question(ans)
+        analysis = analyze_answer(ans)
+        if question is None or analysis is None:
+            return
 
-    def __from_cache(self, client_data: DNSRecord) -> bytes:
-        query = client_data.reply()
-        match client_data.q.qtype:
-            case QTYPE.A:
-                a_value = self.cache[CacheKey(client_data.q.qname, QTYPE.A)]
-                if not a_value.auth:
-                    try:
-                        return self.__get_and_save_answer(client_data.pack())
-                    except ForwarderTimeout:
-                        pass
-                for answer in a_value.data:
-                    query.add_answer(
-                        RR(
-                            rname=answer.rname,
-                            rclass=answer.rclass,
-                            rtype=answer.rtype,
-                            ttl=int(a_value.expiry_time - time.time()),
-                            rdata=answer.rdata
-                        )
-                    )
-                ns_value = self.cache[CacheKey(client_data.q.qname, QTYPE.NS)]
-                for ns in ns_value.data:
-                    query.add_auth(
-                        RR(
-                            rname=ns.rname,
-                            rclass=ns.rclass,
-                            rtype=ns.rtype,
-                            ttl=int(ns_value.expiry_time - time.time()),
-                            rdata=ns.rdata
-                        )
-                    )
-                nsa_value = self.cache[CacheKey(client_data.q.qname, self.NSA_QTYPE)]
-                for nsa in nsa_value.data:
-                    query.ar(
-                        RR(
-                            rname=nsa.rname,
-                            rclass=nsa.rclass,
-                            rtype=nsa.rtype,
-                            ttl=int(ns_value.expiry_time - time.time()),
-                            rdata=nsa.rdata
-                        )
-                    )
-            case QTYPE.PTR:
-                ptr_value = self.cache[CacheKey(client_data.q.qname, QTYPE.PTR)]
-                if not ptr_value.auth:
-                    try:
-                        return self.__get_and_save_answer(client_data.pack())
-                    except ForwarderTimeout:
-                        pass
-                for ptr in ptr_value.data:
-                    query.add_auth(
-                        RR(
-                            rname=ptr.rname,
-                            rclass=ptr.rclass,
-                            rtype=ptr.rtype,
-                            ttl=int(ptr_value.expiry_time - time.time()),
-                            rdata=ptr.rdata
-                        )
-                    )
-            case QTYPE.NS:
-                ns_value = self.cache[CacheKey(client_data.q.qname, QTYPE.NS)]
-                if not ns_value.auth:
-                    try:
-                        return self.__get_and_save_answer(client_data.pack())
-                    except ForwarderTimeout:
-                        pass
-                for ns in ns_value.data:
-                    query.add_answer(
-                        RR(
-                            rname=ns.rname,
-                            rclass=ns.rclass,
-                            rtype=ns.rtype,
-                            ttl=int(ns_value.expiry_time - time.time()),
-                            rdata=ns.rdata
-                        )
-                    )
-                nsa_value = self.cache[CacheKey(client_data.q.qname, self.NSA_QTYPE)]
-                for nsa in nsa_value.data:
-                    query.ar(
-                        RR(
-                            rname=nsa.rname,
-                            rclass=nsa.rclass,
-                            rtype=nsa.rtype,
-                            ttl=int(nsa_value.expiry_time - time.time()),
-                            rdata=nsa.rdata
-                        )
-                    )
-
-        self.debug_print(query)
-        return query.pack()
-
-    def __ask_forwarder(self, data_bytes: bytes) -> bytes:
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            sock.settimeout(1)
-            try:
-                sock.connect(self.forwarder_server)
-                sock.send(data_bytes)
-
-                answer = sock.recv(1024)
-                return answer
-            except socket.timeout:
-                raise ForwarderTimeout
+        name, q_type, q_class, _ = question
+        offsets, ttl, negative = analysis
+        ttl = min(ttl, self.MAX_NEGATIVE_TTL if negative else self.MAX_TTL)
+        self.cache[CacheKey(name.lower(), q_type, q_class)] = CacheValue(
+            int(time.time()) + ttl,
+            ans,
+            offsets,
+            ttl,
+            negative
+        )
 
     def save_cache(self) -> None:
-        with open(self.cache_file_name, "wb") as file:
-            pickle.dump(self.cache, file)
+        if self._checkpointer is not None:
+            self._checkpointer.wait()
+        write_snapshot(self.cache_file_name, self.cache.items(), int(time.time()))
+
+    def stats(self) -> dict[str, int]:
+        # a worker reports its hits to the keeper, the pool owner's stats hold the counters
+        stats = self.cache.stats() if isinstance(self.cache, CacheStore) else dict()
+        return stats | self.metrics.counters() | {
+            "saved_upstream_queries": self.saved_upstream_queries,
+            "suppressed_logs": self.log.suppressed
+        }
 
     def debug_print(self, value) -> None:
         if self._debug:
-            print(value)
+            self.log(value)
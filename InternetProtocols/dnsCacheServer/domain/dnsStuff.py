@@ -1,47 +1,74 @@
-from dnslib import RR, DNSLabel
+from typing import NamedTuple
 
+from dnslib import CLASS, DNSLabel, DNSRecord, QTYPE
 
-class CacheKey:
-    def __init__(self, name: DNSLabel, q_type: int):
-        self.name = name
-        self.q_type = q_type
 
-    def __hash__(self):
-        return hash(self.name) * hash(self.q_type)
+class CacheKey(NamedTuple):
+    # name is the lower-cased wire-format owner name, so hashing and comparison stay in C
+    name: bytes
+    q_type: int
+    q_class: int = CLASS.IN
 
-    def __eq__(self, other):
-        if other is None or type(other).__name__ != "CacheKey":
-            return False
-        else:
-            return (self.name == other.name and
-                    self.q_type == other.q_type)
+    @classmethod
+    def from_label(cls, label: DNSLabel, q_type: int, q_class: int = CLASS.IN) -> "CacheKey":
+        return cls(
+            b"".join(bytes((len(part),)) + part.lower() for part in label.label) + b"\0",
+            q_type,
+            q_class
+        )
+
+    def label(self) -> DNSLabel:
+        parts = list()
+        offset = 0
+        while self.name[offset]:
+            parts.append(self.name[offset + 1:offset + 1 + self.name[offset]])
+            offset += self.name[offset] + 1
+        return DNSLabel(parts)
+
+    def size(self) -> int:
+        # rough footprint in bytes: the tuple plus the name bytes object
+        return 90 + len(self.name)
 
     def __str__(self):
-        return f"name: {self.name} " + f"type: {self.q_type}"
+        return f"name: {self.label()} " + f"type: {QTYPE.get(self.q_type)} " + f"class: {CLASS.get(self.q_class)}"
 
     def __repr__(self):
         return self.__str__()
 
 
 class CacheValue:
-    def __init__(self, ttl: int, data: set[RR], authoritative: bool):
-        self.expiry_time = ttl
-        self.data = data
-        self.auth = authoritative
+    # a whole upstream response; hits patch its ID and the TTLs at ttl_offsets
+    __slots__ = ("expiry_time", "wire", "ttl_offsets", "original_ttl", "negative", "hits")
+
+    def __init__(
+            self,
+            expiry_time: int,
+            wire: bytes,
+            ttl_offsets: tuple[int, ...],
+            original_ttl: int,
+            negative: bool = False
+    ):
+        self.expiry_time = expiry_time
+        self.wire = wire
+        self.ttl_offsets = ttl_offsets
+        self.original_ttl = original_ttl
+        self.negative = negative
+        self.hits = 0
 
-    def __hash__(self):
-        return hash(self.expiry_time) * hash(self.data) * hash(self.auth)
+    def size(self) -> int:
+        # rough footprint in bytes: the object, the packed response and the offsets tuple
+        return 120 + len(self.wire) + 8 * len(self.ttl_offsets)
 
     def __eq__(self, other):
-        if other is None or type(other).__name__ != "CacheValue":
+        if not isinstance(other, CacheValue):
             return False
         else:
             return (self.expiry_time == other.expiry_time and
-                    self.data == other.data and
-                    self.auth == other.auth)
+                    self.wire == other.wire)
 
     def __str__(self):
-        return f"expiry time: {self.expiry_time} " + f"auth: {self.auth} " + "data: " + " ".join(map(lambda x: str(x), self.data))
+        return (f"expiry time: {self.expiry_time} " + f"negative: {self.negative} " +
+                "data: " + " ".join(map(lambda x: str(x), DNSRecord.parse(self.wire).rr)))
 
     def __repr__(self):
         return self.__str__()
@@ -0,0 +1,272 @@
+import asyncio
+import secrets
+import socket
+import struct
+import threading
+import time
+from typing import Callable
+
+from .dnsStuff import ForwarderTimeout
+from .protocols import ForwarderProtocol
+from .wire import HEADER_SIZE, TC_FLAG, read_question
+
+MIN_ATTEMPT_TIMEOUT = 0.2
+
+
+class Forwarder:
+    RTT_WEIGHT = 0.2
+    # a failed forwarder is not probed for HOLD_OFF seconds, twice as long after every failure in a row
+    HOLD_OFF = 1.0
+    MAX_HOLD_OFF = 60.0
+
+    def __init__(self, address: tuple[str, int]):
+        self.address = address
+        # untried forwarders sort first, so every forwarder gets measured
+        self.srtt = 0.0
+        self.failures = 0
+        self.failed_at = 0.0
+        self.retry_at = 0.0
+
+    def update_rtt(self, rtt: float) -> None:
+        self.srtt = rtt if self.srtt == 0 else (1 - self.RTT_WEIGHT) * self.srtt + self.RTT_WEIGHT * rtt
+        self.failures = 0
+
+    def penalize(self, started: float) -> None:
+        # attempts sent before the last failure was seen belong to the same outage
+        if self.failures and started < self.failed_at:
+            return
+        self.failures += 1
+        self.failed_at = time.monotonic()
+        self.retry_at = self.failed_at + min(self.HOLD_OFF * 2 ** (self.failures - 1), self.MAX_HOLD_OFF)
+
+    def __str__(self):
+        return f"{self.address[0]}:{self.address[1]} srtt={self.srtt * 1000:.1f}ms failures={self.failures}"
+
+
+class ForwarderPool:
+    def __init__(
+            self,
+            servers: list[tuple[str, int]],
+            timeout: float,
+            on_rtt: Callable[[float], None] = lambda rtt: None
+    ):
+        self.forwarders = [Forwarder(address) for address in servers]
+        self.timeout = timeout
+        self._on_rtt = on_rtt
+        self._sockets: dict[tuple[str, int], socket.socket] = dict()
+        self._endpoints: dict[tuple[str, int], tuple[asyncio.DatagramTransport, ForwarderProtocol]] = dict()
+        self._probes: set[asyncio.Task] = set()
+
+    def ask(self, query: bytes) -> bytes:
+        for forwarder in self.__due_probes():
+            threading.Thread(target=self.__probe, args=(forwarder, query), daemon=True).start()
+        deadline = time.monotonic() + self.timeout
+        for forwarder, attempt_deadline in self.__attempts(deadline):
+            started = time.monotonic()
+            try:
+                return self.__ask_udp(forwarder, query, attempt_deadline, deadline)
+            except (socket.timeout, OSError):
+                forwarder.penalize(started)
+                self.__drop_socket(forwarder)
+        raise ForwarderTimeout
+
+    async def ask_async(self, query: bytes) -> bytes:
+        for forwarder in self.__due_probes():
+            probe = asyncio.ensure_future(self.__probe_async(forwarder, query))
+            self._probes.add(probe)
+            probe.add_done_callback(self._probes.discard)
+        deadline = time.monotonic() + self.timeout
+        for forwarder, attempt_deadline in self.__attempts(deadline):
+            started = time.monotonic()
+            try:
+                return await asyncio.wait_for(
+                    self.__ask_udp_async(forwarder, query, deadline),
+                    attempt_deadline - time.monotonic()
+                )
+            except (asyncio.TimeoutError, ForwarderTimeout, OSError):
+                forwarder.penalize(started)
+                self.__drop_endpoint(forwarder)
+        raise ForwarderTimeout
+
+    def close(self) -> None:
+        for probe in self._probes:
+            probe.cancel()
+        for forwarder in self.forwarders:
+            self.__drop_socket(forwarder)
+            self.__drop_endpoint(forwarder)
+
+    def __due_probes(self) -> list[Forwarder]:
+        # A failed forwarder whose hold-off is over gets a copy of the query next to the healthy
+        # one instead of being asked in front of it: no client waits for it to come back.
+        if all(forwarder.failures for forwarder in self.forwarders):
+            return []
+        now = time.monotonic()
+        due = [forwarder for forwarder in self.forwarders if forwarder.failures and forwarder.retry_at <= now]
+        for forwarder in due:
+            # one probe at a time
+            forwarder.retry_at = now + self.timeout
+        return due
+
+    def __probe(self, forwarder: Forwarder, query: bytes) -> None:
+        # a socket of its own, the pool's ones belong to the serving thread
+        sent = time.monotonic()
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.connect(forwarder.address)
+                packet = _with_random_id(query)
+                sock.send(packet)
+                _receive_answer(sock, packet, sent + self.timeout)
+                self.__measured(forwarder, time.monotonic() - sent)
+        except (socket.timeout, OSError):
+            forwarder.penalize(sent)
+
+    async def __probe_async(self, forwarder: Forwarder, query: bytes) -> None:
+        sent = time.monotonic()
+        try:
+            await asyncio.wait_for(
+                self.__ask_udp_async(forwarder, query, time.monotonic() + self.timeout),
+                self.timeout
+            )
+        except (asyncio.TimeoutError, ForwarderTimeout, OSError):
+            forwarder.penalize(sent)
+            self.__drop_endpoint(forwarder)
+
+    def __attempts(self, deadline: float):
+        # healthy forwarders fastest first, failed ones only after them; every attempt but the last
+        # gets a few smoothed RTTs, the last one the rest
+        ordered = sorted(self.forwarders, key=lambda forwarder: (forwarder.failures > 0, forwarder.srtt))
+        for i, forwarder in enumerate(ordered):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if i == len(ordered) - 1:
+                yield forwarder, deadline
+            else:
+                yield forwarder, time.monotonic() + min(remaining, max(4 * forwarder.srtt, MIN_ATTEMPT_TIMEOUT))
+
+    def __ask_udp(self, forwarder: Forwarder, query: bytes, attempt_deadline: float, deadline: float) -> bytes:
+        sock = self.__socket(forwarder)
+        packet = _with_random_id(query)
+        sent = time.monotonic()
+        sock.send(packet)
+        answer = _receive_answer(sock, packet, attempt_deadline)
+        self.__measured(forwarder, time.monotonic() - sent)
+
+        if answer[2] & TC_FLAG:
+            answer = self.__ask_tcp(forwarder, packet, deadline)
+        return query[:2] + answer[2:]
+
+    async def __ask_udp_async(self, forwarder: Forwarder, query: bytes, deadline: float) -> bytes:
+        transport, protocol = await self.__endpoint(forwarder)
+        packet = _with_random_id(query, protocol.pending)
+        answer = asyncio.get_running_loop().create_future()
+        protocol.pending[packet[:2]] = answer
+        sent = time.monotonic()
+        try:
+            transport.sendto(packet)
+            while True:
+                data = await answer
+                if _matches(packet, data):
+                    break
+                answer = asyncio.get_running_loop().create_future()
+                protocol.pending[packet[:2]] = answer
+        finally:
+            if protocol.pending.get(packet[:2]) is answer:
+                del protocol.pending[packet[:2]]
+        self.__measured(forwarder, time.monotonic() - sent)
+
+        if data[2] & TC_FLAG:
+            data = await self.__ask_tcp_async(forwarder, packet, deadline)
+        return query[:2] + data[2:]
+
+    def __measured(self, forwarder: Forwarder, rtt: float) -> None:
+        forwarder.update_rtt(rtt)
+        self._on_rtt(rtt)
+
+    def __ask_tcp(self, forwarder: Forwarder, packet: bytes, deadline: float) -> bytes:
+        with socket.create_connection(forwarder.address, max(deadline - time.monotonic(), 0.001)) as sock:
+            sock.sendall(struct.pack("!H", len(packet)) + packet)
+            length = struct.unpack("!H", _recv_exactly(sock, 2))[0]
+            return _recv_exactly(sock, length)
+
+    async def __ask_tcp_async(self, forwarder: Forwarder, packet: bytes, deadline: float) -> bytes:
+        async def exchange() -> bytes:
+            reader, writer = await asyncio.open_connection(*forwarder.address)
+            try:
+                writer.write(struct.pack("!H", len(packet)) + packet)
+                length = struct.unpack("!H", await reader.readexactly(2))[0]
+                return await reader.readexactly(length)
+            finally:
+                writer.close()
+
+        return await asyncio.wait_for(exchange(), max(deadline - time.monotonic(), 0.001))
+
+    def __socket(self, forwarder: Forwarder) -> socket.socket:
+        sock = self._sockets.get(forwarder.address)
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.connect(forwarder.address)
+            self._sockets[forwarder.address] = sock
+        return sock
+
+    def __drop_socket(self, forwarder: Forwarder) -> None:
+        # a fresh socket also gets a fresh source port
+        sock = self._sockets.pop(forwarder.address, None)
+        if sock is not None:
+            sock.close()
+
+    async def __endpoint(self, forwarder: Forwarder) -> tuple[asyncio.DatagramTransport, ForwarderProtocol]:
+        endpoint = self._endpoints.get(forwarder.address)
+        if endpoint is None or endpoint[0].is_closing():
+            endpoint = await asyncio.get_running_loop().create_datagram_endpoint(
+                ForwarderProtocol,
+                remote_addr=forwarder.address
+            )
+            if forwarder.address in self._endpoints and not self._endpoints[forwarder.address][0].is_closing():
+                # another query opened the endpoint while this one was waiting
+                endpoint[0].close()
+                return self._endpoints[forwarder.address]
+            self._endpoints[forwarder.address] = endpoint
+        return endpoint
+
+    def __drop_endpoint(self, forwarder: Forwarder) -> None:
+        endpoint = self._endpoints.get(forwarder.address)
+        if endpoint is not None and not endpoint[1].pending:
+            del self._endpoints[forwarder.address]
+            endpoint[0].close()
+
+
+def _with_random_id(query: bytes, in_flight: dict[bytes, asyncio.Future] | None = None) -> bytes:
+    while True:
+        txid = secrets.token_bytes(2)
+        if in_flight is None or txid not in in_flight:
+            return txid + query[2:]
+
+
+def _receive_answer(sock: socket.socket, packet: bytes, deadline: float) -> bytes:
+    while True:
+        sock.settimeout(max(deadline - time.monotonic(), 0.001))
+        answer = sock.recv(65535)
+        # anything else is a late answer to an earlier attempt or a spoofing attempt
+        if _matches(packet, answer):
+            return answer
+
+
+def _matches(packet: bytes, answer: bytes) -> bool:
+    if len(answer) < HEADER_SIZE or answer[:2] != packet[:2]:
+        return False
+    question = read_question(packet)
+    if question is None:
+        return True
+    question_end = question[3]
+    return answer[HEADER_SIZE:question_end].lower() == packet[HEADER_SIZE:question_end].lower()
+
+
+def _recv_exactly(sock: socket.socket, length: int) -> bytes:
+    data = bytearray()
+    while len(data) < length:
+        chunk = sock.recv(length - len(data))
+        if not chunk:
+            raise ConnectionError("forwarder closed the TCP connection")
+        data += chunk
+    return bytes(data)
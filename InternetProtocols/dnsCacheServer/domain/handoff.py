@@ -0,0 +1,104 @@
+import os
+import socket
+import threading
+import time
+from typing import Iterable
+
+from .dnsStuff import CacheKey, CacheValue
+from .snapshot import dump_snapshot
+
+# The old process passes its bound UDP socket with SCM_RIGHTS, streams the cache in the snapshot
+# format and keeps serving until the new process reports READY, so no query goes unanswered.
+READY = b"R"
+
+
+class HandoffError(Exception):
+    pass
+
+
+class HandoffListener:
+    def __init__(self, path: str, max_stale: int = 0):
+        self.path = path
+        self.max_stale = max_stale
+        _unlink(path)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(path)
+        self._listener.listen(1)
+        self._listener.setblocking(False)
+        self._conn: socket.socket | None = None
+
+    def poll(self, sock: socket.socket, items: Iterable[tuple[CacheKey, CacheValue]]) -> bool:
+        # True once a successor serves the socket and this process should stop
+        if self._conn is None:
+            try:
+                conn, _ = self._listener.accept()
+            except BlockingIOError:
+                return False
+            conn.setblocking(True)
+            socket.send_fds(conn, [b"H"], [sock.fileno()])
+            # this process answers from the cache until the successor is ready, and whatever it adds
+            # meanwhile stays behind: the successor asks the forwarder for it again
+            threading.Thread(target=self.__send_cache, args=(conn, list(items)), daemon=True).start()
+            self._conn = conn
+            return False
+
+        try:
+            reply = self._conn.recv(1, socket.MSG_DONTWAIT)
+        except BlockingIOError:
+            return False
+        except OSError:
+            reply = b""
+        if reply == READY:
+            return True
+        # the successor died before it took over: keep serving and wait for the next one
+        self._conn.close()
+        self._conn = None
+        return False
+
+    def close(self, handed_over: bool = False) -> None:
+        if self._conn is not None:
+            self._conn.close()
+        self._listener.close()
+        if not handed_over:
+            # after a handoff the path already belongs to the successor's listener
+            _unlink(self.path)
+
+    def __send_cache(self, conn: socket.socket, items: list[tuple[CacheKey, CacheValue]]) -> None:
+        try:
+            with conn.makefile("wb") as stream:
+                dump_snapshot(stream, items, int(time.time()), self.max_stale)
+            conn.shutdown(socket.SHUT_WR)
+        except OSError as err:
+            print(f"handoff failed: {err}")
+
+
+class Handoff:
+    def __init__(self, path: str):
+        self._conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._conn.connect(path)
+            _, fds, _, _ = socket.recv_fds(self._conn, 1, 1)
+        except OSError as err:
+            self._conn.close()
+            raise HandoffError(f"no server to take over at {path}: {err}")
+        if not fds:
+            self._conn.close()
+            raise HandoffError("the old server did not pass its socket")
+        self.socket = socket.socket(fileno=fds[0])
+
+    def receive_cache(self) -> bytes:
+        with self._conn.makefile("rb") as stream:
+            return stream.read()
+
+    def ready(self) -> None:
+        try:
+            self._conn.sendall(READY)
+        finally:
+            self._conn.close()
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
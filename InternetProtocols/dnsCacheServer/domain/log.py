@@ -0,0 +1,26 @@
+import time
+
+
+class RateLimitedLog:
+    # at most `rate` messages per second reach the console, the rest are only counted
+    def __init__(self, rate: int = 10):
+        self.rate = rate
+        self.suppressed = 0
+        self._dropped = 0
+        self._window = 0
+        self._printed = 0
+
+    def __call__(self, message: object) -> None:
+        window = int(time.monotonic())
+        if window != self._window:
+            if self._dropped:
+                print(f"... {self._dropped} messages suppressed")
+            self._window = window
+            self._printed = 0
+            self._dropped = 0
+        if self.rate > 0 and self._printed >= self.rate:
+            self._dropped += 1
+            self.suppressed += 1
+            return
+        self._printed += 1
+        print(message)
@@ -0,0 +1,125 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Callable
+
+
+class Histogram:
+    # log2 buckets of microseconds: bucket i counts values below 2**i us, the last one is open ended
+    BUCKETS = 24
+
+    __slots__ = ("counts", "count", "total")
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[min(int(seconds * 1e6).bit_length(), self.BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q: float) -> float:
+        # upper bound of the bucket holding the q-th value, in seconds
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen and seen >= q * self.count:
+                return (1 << i) / 1e6
+        return 0.0
+
+    def summary(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "p999": self.quantile(0.999)
+        }
+
+
+class Metrics:
+    # Every field is written by the serving thread only, the stats thread just reads,
+    # so plain ints are enough and the hot path never takes a lock.
+    COUNTERS = (
+        "queries",
+        "cache_answers",
+        "forwarder_answers",
+        "stale_answers",
+        "failed_answers",
+        "forwarder_timeouts",
+        "parse_errors",
+        "errors",
+    )
+    HISTOGRAMS = ("cache_answer_seconds", "forwarder_answer_seconds", "forwarder_rtt_seconds")
+
+    def __init__(self):
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+        for name in self.HISTOGRAMS:
+            setattr(self, name, Histogram())
+
+    def counters(self) -> dict[str, int]:
+        return {name: getattr(self, name) for name in self.COUNTERS}
+
+    def histograms(self) -> dict[str, Histogram]:
+        return {name: getattr(self, name) for name in self.HISTOGRAMS}
+
+
+def render_prometheus(counters: dict[str, int], histograms: dict[str, Histogram]) -> str:
+    lines = list()
+    for name, value in counters.items():
+        lines.append(f"dns_{name} {value}")
+    for name, histogram in histograms.items():
+        cumulative = 0
+        for i, count in enumerate(histogram.counts[:-1]):
+            cumulative += count
+            lines.append(f'dns_{name}_bucket{{le="{(1 << i) / 1e6:g}"}} {cumulative}')
+        lines.append(f'dns_{name}_bucket{{le="+Inf"}} {histogram.count}')
+        lines.append(f"dns_{name}_sum {histogram.total:.6f}")
+        lines.append(f"dns_{name}_count {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    # /metrics in the Prometheus text format, /stats as JSON with percentiles
+    def __init__(
+            self,
+            address: tuple[str, int],
+            counters: Callable[[], dict[str, int]],
+            histograms: Callable[[], dict[str, Histogram]] = dict
+    ):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                match self.path:
+                    case "/metrics":
+                        body = render_prometheus(counters(), histograms()).encode()
+                        content_type = "text/plain; version=0.0.4"
+                    case "/stats":
+                        stats = counters() | {name: value.summary() for name, value in histograms().items()}
+                        body = json.dumps(stats).encode()
+                        content_type = "application/json"
+                    case _:
+                        self.send_error(404)
+                        return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = HTTPServer(address, Handler)
+        self.address = self._httpd.server_address
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    def start(self) -> "MetricsServer":
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,52 @@
+import asyncio
+from typing import Callable
+
+from .dnsStuff import ForwarderTimeout
+from .log import RateLimitedLog
+from .metrics import Metrics
+
+
+class ServerProtocol(asyncio.DatagramProtocol):
+    def __init__(
+            self,
+            on_request: Callable[[asyncio.DatagramTransport, bytes, tuple], None],
+            log: RateLimitedLog,
+            metrics: Metrics
+    ):
+        self._on_request = on_request
+        self._log = log
+        self._metrics = metrics
+        self.transport: asyncio.DatagramTransport | None = None
+
+    def connection_made(self, transport: asyncio.DatagramTransport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr: tuple) -> None:
+        self._on_request(self.transport, data, addr)
+
+    def error_received(self, exc: Exception) -> None:
+        self._metrics.errors += 1
+        self._log(exc)
+
+
+class ForwarderProtocol(asyncio.DatagramProtocol):
+    # one connected socket per forwarder, answers are matched to waiters by transaction ID
+    def __init__(self):
+        self.pending: dict[bytes, asyncio.Future] = dict()
+
+    def datagram_received(self, data: bytes, addr: tuple) -> None:
+        answer = self.pending.pop(data[:2], None)
+        if answer is not None and not answer.done():
+            answer.set_result(data)
+
+    def error_received(self, exc: Exception) -> None:
+        self.__fail_pending(exc)
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        self.__fail_pending(exc)
+
+    def __fail_pending(self, exc: Exception | None) -> None:
+        for answer in self.pending.values():
+            if not answer.done():
+                answer.set_exception(ForwarderTimeout(exc))
+        self.pending.clear()
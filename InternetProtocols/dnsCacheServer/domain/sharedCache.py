@@ -0,0 +1,206 @@
+import os
+import threading
+import time
+from collections import deque
+from multiprocessing.connection import Client, Connection, Listener, wait
+from typing import Callable, ItemsView, Iterator, MutableMapping
+
+from .cacheStore import CacheStore
+from .dnsStuff import CacheKey, CacheValue
+
+# Every worker answers hits from its own CacheStore, a read-through copy of the keeper's one:
+# the keeper is asked only on a local miss, and writes go through to it. The keeper pushes each
+# write to the other workers, which refresh the keys they hold, so a hit costs no round trip.
+REQUESTS = "requests"
+PUSHES = "pushes"
+
+
+class CacheKeeper:
+    TICK = 0.1
+    EXPIRE_BUDGET = 0.005
+
+    def __init__(self, cache: CacheStore, address: str, on_tick: Callable[[], None] = lambda: None):
+        self.cache = cache
+        self._on_tick = on_tick
+        self._listener = Listener(address, family="AF_UNIX")
+        self._connections: list[Connection] = list()
+        self._workers: dict[Connection, int] = dict()
+        self._pushes: dict[int, Connection] = dict()
+
+    def accept(self, count: int) -> None:
+        # every worker connects twice: requests with replies, and pushes it only reads
+        for _ in range(2 * count):
+            conn = self._listener.accept()
+            role, worker = conn.recv()
+            if role == PUSHES:
+                self._pushes[worker] = conn
+            else:
+                self._connections.append(conn)
+                self._workers[conn] = worker
+
+    def serve(self) -> None:
+        while self._connections:
+            self.cache.expire_within(int(time.time()), self.EXPIRE_BUDGET)
+            self._on_tick()
+            for conn in wait(self._connections, self.TICK):
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    self.__drop(conn)
+                    continue
+                self.__handle(conn, request)
+
+    def close(self) -> None:
+        for conn in self._connections + list(self._pushes.values()):
+            conn.close()
+        self._listener.close()
+
+    def __handle(self, conn: Connection, request: tuple) -> None:
+        match request:
+            case ("get", key):
+                conn.send(self.cache.get(key))
+            case ("lookup", key, now):
+                conn.send(self.cache.lookup(key, now))
+            case ("lookup_stale", key, now):
+                conn.send(self.cache.lookup_stale(key, now))
+            case ("set", key, value):
+                self.cache[key] = value
+                self.__push(self._workers[conn], ("set", key, value))
+            case ("del", key):
+                self.cache.pop(key, None)
+                self.__push(self._workers[conn], ("del", key))
+            case ("hits", count):
+                # hits answered from the workers' copies, so the owner's stats count them
+                self.cache.hits += count
+            case ("len",):
+                conn.send(len(self.cache))
+            case ("keys",):
+                conn.send(list(self.cache))
+
+    def __push(self, sender: int, message: tuple) -> None:
+        for worker, conn in list(self._pushes.items()):
+            if worker == sender:
+                continue
+            try:
+                conn.send(message)
+            except OSError:
+                del self._pushes[worker]
+                conn.close()
+
+    def __drop(self, conn: Connection) -> None:
+        self._connections.remove(conn)
+        conn.close()
+        pushes = self._pushes.pop(self._workers.pop(conn), None)
+        if pushes is not None:
+            pushes.close()
+
+
+class SharedCache(MutableMapping[CacheKey, CacheValue]):
+    # the sync server ticks after every query, the hit count goes to the keeper at most this often
+    REPORT_INTERVAL = 1.0
+
+    def __init__(self, address: str, local: CacheStore):
+        self.local = local
+        self._reported_hits = 0
+        self._reported_at = time.monotonic()
+        self._conn = Client(address, family="AF_UNIX")
+        self._conn.send((REQUESTS, os.getpid()))
+        self._push_conn = Client(address, family="AF_UNIX")
+        self._push_conn.send((PUSHES, os.getpid()))
+        # filled by the reader thread, applied by the serving thread: the store itself is not locked
+        self._pushed: deque[tuple] = deque()
+        threading.Thread(target=self.__receive_pushes, daemon=True).start()
+
+    def get(self, key: CacheKey, default: CacheValue | None = None) -> CacheValue | None:
+        self._conn.send(("get", key))
+        value = self._conn.recv()
+        return default if value is None else value
+
+    def lookup(self, key: CacheKey, now: int) -> CacheValue | None:
+        if self._pushed:
+            self.__apply_pushes()
+        value = self.local.lookup(key, now)
+        if value is not None:
+            return value
+        self._conn.send(("lookup", key, now))
+        value = self._conn.recv()
+        if value is not None:
+            self.local[key] = value
+        return value
+
+    def lookup_stale(self, key: CacheKey, now: int) -> CacheValue | None:
+        value = self.local.lookup_stale(key, now)
+        if value is not None:
+            return value
+        self._conn.send(("lookup_stale", key, now))
+        return self._conn.recv()
+
+    def expire(self, now: int, limit: int | None = None) -> int:
+        # the keeper expires its own store, this only drops the local copies
+        self.__sync()
+        return self.local.expire(now, limit)
+
+    def expire_within(self, now: int, seconds: float) -> int:
+        self.__sync()
+        return self.local.expire_within(now, seconds)
+
+    def clear_expired(self, now: int) -> None:
+        self.expire(now)
+
+    def reconfigure(self, max_entries: int, max_bytes: int, policy: str, max_stale: int) -> None:
+        self.local.reconfigure(max_entries, max_bytes, policy, max_stale)
+
+    def items(self) -> ItemsView[CacheKey, CacheValue]:
+        return self.local.items()
+
+    def __getitem__(self, key: CacheKey) -> CacheValue:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: CacheKey, value: CacheValue) -> None:
+        # no reply: messages are ordered per connection, so the worker still reads its own writes
+        self.local[key] = value
+        self._conn.send(("set", key, value))
+
+    def __delitem__(self, key: CacheKey) -> None:
+        self.local.pop(key, None)
+        self._conn.send(("del", key))
+
+    def __contains__(self, key: object) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        self._conn.send(("len",))
+        return self._conn.recv()
+
+    def __iter__(self) -> Iterator[CacheKey]:
+        self._conn.send(("keys",))
+        return iter(self._conn.recv())
+
+    def __sync(self) -> None:
+        if time.monotonic() - self._reported_at >= self.REPORT_INTERVAL:
+            self._reported_at = time.monotonic()
+            if self.local.hits != self._reported_hits:
+                self._conn.send(("hits", self.local.hits - self._reported_hits))
+                self._reported_hits = self.local.hits
+        if self._pushed:
+            self.__apply_pushes()
+
+    def __receive_pushes(self) -> None:
+        # always reading, so the keeper never blocks on a busy worker
+        try:
+            while True:
+                self._pushed.append(self._push_conn.recv())
+        except (EOFError, OSError):
+            pass
+
+    def __apply_pushes(self) -> None:
+        while self._pushed:
+            match self._pushed.popleft():
+                case ("set", key, value) if key in self.local:
+                    # only keys this worker holds are refreshed, the others are read through when asked
+                    self.local[key] = value
+                case ("del", key):
+                    self.local.pop(key, None)
@@ -0,0 +1,128 @@
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import BinaryIO, Iterable, Iterator
+
+from .dnsStuff import CacheKey, CacheValue
+from .wire import ttl_offsets
+
+MAGIC = b"DNSC"
+VERSION = 1
+HEADER = struct.Struct("!4sHI")
+# name length, q_type, q_class, absolute expiry time, original TTL, flags, payload length
+RECORD = struct.Struct("!BHHqIBI")
+
+FLAG_NEGATIVE = 0x01
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def write_snapshot(
+        file_name: str,
+        items: Iterable[tuple[CacheKey, CacheValue]],
+        now: int,
+        max_stale: int = 0
+) -> int:
+    tmp_name = file_name + ".tmp"
+    with open(tmp_name, "wb") as file:
+        count = dump_snapshot(file, items, now, max_stale)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_name, file_name)
+    return count
+
+
+def dump_snapshot(
+        file: BinaryIO,
+        items: Iterable[tuple[CacheKey, CacheValue]],
+        now: int,
+        max_stale: int = 0
+) -> int:
+    records = [(key, value) for key, value in items if value.expiry_time + max_stale > now]
+    file.write(HEADER.pack(MAGIC, VERSION, len(records)))
+    for key, value in records:
+        file.write(RECORD.pack(
+            len(key.name),
+            key.q_type,
+            key.q_class,
+            value.expiry_time,
+            value.original_ttl,
+            FLAG_NEGATIVE if value.negative else 0,
+            len(value.wire)
+        ))
+        file.write(key.name)
+        file.write(value.wire)
+    return len(records)
+
+
+def read_snapshot(file_name: str, now: int, max_stale: int = 0) -> Iterator[tuple[CacheKey, CacheValue]]:
+    with open(file_name, "rb") as file:
+        if os.fstat(file.fileno()).st_size < HEADER.size:
+            raise SnapshotError("snapshot is too short")
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield from parse_snapshot(data, now, max_stale)
+
+
+def parse_snapshot(data: bytes | mmap.mmap, now: int, max_stale: int = 0) -> Iterator[tuple[CacheKey, CacheValue]]:
+    if len(data) < HEADER.size:
+        raise SnapshotError("snapshot is too short")
+    magic, version, count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise SnapshotError(f"unsupported snapshot format: {magic!r} v{version}")
+
+    offset = HEADER.size
+    for _ in range(count):
+        if offset + RECORD.size > len(data):
+            raise SnapshotError("snapshot is truncated")
+        name_length, q_type, q_class, expiry_time, original_ttl, flags, payload_length = \
+            RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if offset + name_length + payload_length > len(data):
+            raise SnapshotError("snapshot is truncated")
+
+        if expiry_time + max_stale <= now:
+            offset += name_length + payload_length
+            continue
+
+        name = data[offset:offset + name_length]
+        offset += name_length
+        payload = data[offset:offset + payload_length]
+        offset += payload_length
+        yield (
+            CacheKey(name, q_type, q_class),
+            CacheValue(expiry_time, payload, ttl_offsets(payload), original_ttl, bool(flags & FLAG_NEGATIVE))
+        )
+
+
+class Checkpointer:
+    def __init__(self, file_name: str, interval: int, max_stale: int = 0):
+        self.file_name = file_name
+        self.interval = interval
+        self.max_stale = max_stale
+        self._next_checkpoint = time.monotonic() + interval
+        self._thread: threading.Thread | None = None
+
+    def tick(self, items: Iterable[tuple[CacheKey, CacheValue]]) -> None:
+        if self.interval <= 0 or time.monotonic() < self._next_checkpoint or self.busy():
+            return
+        self._next_checkpoint = time.monotonic() + self.interval
+        # queries keep changing the cache while the file is written, so the thread gets a copy
+        self._thread = threading.Thread(target=self.__write, args=(list(items),), daemon=True)
+        self._thread.start()
+
+    def busy(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def wait(self) -> None:
+        if self._thread is not None:
+            self._thread.join()
+
+    def __write(self, items: list[tuple[CacheKey, CacheValue]]) -> None:
+        try:
+            write_snapshot(self.file_name, items, int(time.time()), self.max_stale)
+        except OSError as err:
+            print(f"checkpoint failed: {err}")
@@ -0,0 +1,118 @@
+import struct
+from typing import Iterator
+
+from dnslib import QTYPE, RCODE
+
+HEADER_SIZE = 12
+TC_FLAG = 0x02
+ANSWER, AUTHORITY, ADDITIONAL = 1, 2, 3
+_RR_FIXED = struct.Struct("!HHIH")
+_TTL = struct.Struct("!I")
+
+
+def read_question(msg: bytes) -> tuple[bytes, int, int, int] | None:
+    if struct.unpack_from("!H", msg, 4)[0] != 1:
+        return None
+
+    offset = HEADER_SIZE
+    while True:
+        length = msg[offset]
+        if length == 0:
+            offset += 1
+            break
+        if length & 0xC0:
+            return None
+        offset += length + 1
+
+    q_type, q_class = struct.unpack_from("!HH", msg, offset)
+    return msg[HEADER_SIZE:offset], q_type, q_class, offset + 4
+
+
+def skip_name(msg: bytes, offset: int) -> int:
+    while True:
+        length = msg[offset]
+        if length == 0:
+            return offset + 1
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        offset += length + 1
+
+
+def records(msg: bytes) -> Iterator[tuple[int, int, int, int, int]]:
+    # (section, r_type, TTL field offset, rdata offset, rdata length) of every RR after the question
+    counts = struct.unpack_from("!HHHH", msg, 4)
+    offset = HEADER_SIZE
+    for _ in range(counts[0]):
+        offset = skip_name(msg, offset) + 4
+
+    for section in (ANSWER, AUTHORITY, ADDITIONAL):
+        for _ in range(counts[section]):
+            offset = skip_name(msg, offset)
+            r_type, _, _, rd_length = _RR_FIXED.unpack_from(msg, offset)
+            yield section, r_type, offset + 4, offset + _RR_FIXED.size, rd_length
+            offset += _RR_FIXED.size + rd_length
+
+
+def ttl_offsets(msg: bytes) -> tuple[int, ...]:
+    # the TTL field of an EDNS OPT pseudo-record holds flags, not a TTL
+    return tuple(ttl_offset for _, r_type, ttl_offset, _, _ in records(msg) if r_type != QTYPE.OPT)
+
+
+def analyze_answer(msg: bytes) -> tuple[tuple[int, ...], int, bool] | None:
+    # TTL offsets, cache TTL and whether the answer is negative; None if it must not be cached
+    if len(msg) < HEADER_SIZE or msg[2] & TC_FLAG:
+        return None
+    r_code = msg[3] & 0x0F
+    if r_code not in (RCODE.NOERROR, RCODE.NXDOMAIN):
+        return None
+
+    offsets = list()
+    min_ttl = None
+    negative_ttl = None
+    try:
+        for section, r_type, ttl_offset, rdata_offset, rd_length in records(msg):
+            if r_type == QTYPE.OPT:
+                continue
+            ttl = _TTL.unpack_from(msg, ttl_offset)[0]
+            offsets.append(ttl_offset)
+            min_ttl = ttl if min_ttl is None else min(min_ttl, ttl)
+            if section == AUTHORITY and r_type == QTYPE.SOA:
+                # RFC 2308: negative answers live for min(SOA TTL, SOA MINIMUM)
+                negative_ttl = min(ttl, _TTL.unpack_from(msg, rdata_offset + rd_length - 4)[0])
+    except (IndexError, struct.error):
+        return None
+
+    an_count = struct.unpack_from("!H", msg, 6)[0]
+    negative = r_code == RCODE.NXDOMAIN or an_count == 0
+    if negative:
+        if negative_ttl is None:
+            return None
+        min_ttl = negative_ttl if min_ttl is None else min(min_ttl, negative_ttl)
+    if not min_ttl:
+        return None
+    return tuple(offsets), min_ttl, negative
+
+
+def _adopt(wire: bytes, request: bytes, question_end: int) -> bytearray:
+    answer = bytearray(wire)
+    answer[0:2] = request[0:2]
+    question = request[HEADER_SIZE:question_end]
+    if question.lower() == wire[HEADER_SIZE:question_end].lower():
+        # echo the client's spelling of the name back, e.g. for 0x20 case randomization
+        answer[HEADER_SIZE:question_end] = question
+    return answer
+
+
+def adopt_answer(wire: bytes, request: bytes) -> bytes:
+    question = read_question(request)
+    if question is None:
+        return request[:2] + wire[2:]
+    return bytes(_adopt(wire, request, question[3]))
+
+
+def patch_answer(wire: bytes, offsets: tuple[int, ...], request: bytes, question_end: int, ttl: int) -> bytes:
+    answer = _adopt(wire, request, question_end)
+    ttl_bytes = struct.pack("!I", max(ttl, 0))
+    for offset in offsets:
+        answer[offset:offset + 4] = ttl_bytes
+    return bytes(answer)
@@ -0,0 +1,87 @@
+import multiprocessing
+import os
+import signal
+import tempfile
+import threading
+import time
+from os import path
+from shutil import rmtree
+from typing import Callable
+
+from .cacheStore import CacheStore
+from .dnsServer import DNSServer
+from .sharedCache import CacheKeeper, SharedCache
+
+
+def _exit_with_parent(parent_pid: int) -> None:
+    # a worker left behind by a killed parent would keep the port but lose the shared cache
+    while os.getppid() == parent_pid:
+        time.sleep(1)
+    os._exit(0)
+
+
+def _run_worker(address: str, local: CacheStore, debug: bool, mode: str, index: int) -> None:
+    threading.Thread(target=_exit_with_parent, args=(os.getppid(),), daemon=True).start()
+    # the pool owner serves stats on the configured port, worker i on the port + i + 1
+    server = DNSServer(debug=debug, cache=SharedCache(address, local), reuse_port=True, metrics_offset=index + 1)
+    try:
+        if mode == "async":
+            server.start_async()
+        else:
+            server.start()
+    except KeyboardInterrupt:
+        pass
+
+
+class WorkerPool:
+    def __init__(self, workers: int, debug: bool = False, mode: str = "sync"):
+        self.workers = workers
+        self._debug = debug
+        self._mode = mode
+
+    def run(self, cache: CacheStore, on_tick: Callable[[], None] = lambda: None) -> None:
+        socket_dir = tempfile.mkdtemp(prefix="dnsCache")
+        keeper = CacheKeeper(cache, path.join(socket_dir, "cache.sock"), on_tick)
+        context = multiprocessing.get_context("fork")
+        processes = [
+            context.Process(
+                target=_run_worker,
+                args=(path.join(socket_dir, "cache.sock"), self.__local_store(cache), self._debug, self._mode, index),
+                daemon=True
+            )
+            for index in range(self.workers)
+        ]
+        try:
+            for process in processes:
+                process.start()
+            self.__forward_reload(processes)
+            keeper.accept(len(processes))
+            keeper.serve()
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
+            keeper.close()
+            rmtree(socket_dir, ignore_errors=True)
+
+    @staticmethod
+    def __local_store(cache: CacheStore) -> CacheStore:
+        # a worker's copy starts empty and is bounded like the shared store
+        return CacheStore(cache.max_entries, cache.max_bytes, cache.policy_name, cache.max_stale)
+
+    @staticmethod
+    def __forward_reload(processes: list[multiprocessing.Process]) -> None:
+        # installed after the fork, so workers keep their own handler
+        if not hasattr(signal, "SIGHUP"):
+            return
+        owner_handler = signal.getsignal(signal.SIGHUP)
+
+        def forward(signum, frame):
+            if callable(owner_handler):
+                owner_handler(signum, frame)
+            for process in processes:
+                if process.is_alive():
+                    os.kill(process.pid, signum)
+
+        signal.signal(signal.SIGHUP, forward)
@@ -0,0 +1,140 @@
+import socket
+import struct
+from array import array
+from bisect import bisect_right
+from typing import Iterable, Iterator
+
+# special-purpose IPv4 ranges, RFC 6890 and the IANA special-purpose address registry
+RESERVED_RANGES = (
+    ("0.0.0.0/8", "This network"),
+    ("10.0.0.0/8", "Private"),
+    ("100.64.0.0/10", "CGNAT"),
+    ("127.0.0.0/8", "Loopback"),
+    ("169.254.0.0/16", "Link-local"),
+    ("172.16.0.0/12", "Private"),
+    ("192.0.0.0/24", "IETF protocol assignments"),
+    ("192.0.2.0/24", "Documentation"),
+    ("192.88.99.0/24", "6to4 relay"),
+    ("192.168.0.0/16", "Private"),
+    ("198.18.0.0/15", "Benchmarking"),
+    ("198.51.100.0/24", "Documentation"),
+    ("203.0.113.0/24", "Documentation"),
+    ("224.0.0.0/4", "Multicast"),
+    ("240.0.0.0/4", "Reserved"),
+    ("255.255.255.255/32", "Broadcast"),
+)
+
+
+def ip_to_int(ip: str) -> int:
+    return struct.unpack("!I", socket.inet_aton(ip))[0]
+
+
+def prefix_range(prefix: str) -> tuple[int, int]:
+    network, _, length = prefix.partition("/")
+    start = ip_to_int(network)
+    size = 1 << (32 - int(length or 32))
+    start &= ~(size - 1) & 0xFFFFFFFF
+    return start, start + size - 1
+
+
+class PrefixIndex:
+    # Disjoint address ranges in sorted arrays: a lookup is one bisect, and a few million ranges
+    # take a few dozen megabytes. Values are deduplicated into a small table.
+    def __init__(self, ranges: Iterable[tuple[int, int, tuple]]):
+        self.values: list[tuple] = list()
+        value_ids: dict[tuple, int] = dict()
+        self.starts = array("I")
+        self.ends = array("I")
+        self.value_ids = array("I")
+        for start, end, value in _flatten(ranges):
+            if value not in value_ids:
+                value_ids[value] = len(self.values)
+                self.values.append(value)
+            self.starts.append(start)
+            self.ends.append(end)
+            self.value_ids.append(value_ids[value])
+
+    @classmethod
+    def load(cls, file_name: str) -> "PrefixIndex":
+        with open(file_name, encoding="utf-8", errors="replace") as file:
+            return cls(_parse_dataset(file))
+
+    def lookup(self, ip: str) -> tuple | None:
+        address = ip_to_int(ip)
+        i = bisect_right(self.starts, address) - 1
+        if i < 0 or address > self.ends[i]:
+            return None
+        return self.values[self.value_ids[i]]
+
+    def __len__(self):
+        return len(self.starts)
+
+
+def _flatten(ranges: Iterable[tuple[int, int, tuple]]) -> Iterator[tuple[int, int, tuple]]:
+    # ranges may nest (a RIB dump has /16 and /24 routes of one block), the most specific one wins
+    open_ranges: list[tuple[int, tuple]] = list()
+    position = 0
+    for start, end, value in sorted(ranges, key=lambda item: (item[0], -item[1])):
+        while open_ranges and open_ranges[-1][0] < start:
+            top_end, top_value = open_ranges.pop()
+            if position <= top_end:
+                yield position, top_end, top_value
+                position = top_end + 1
+        if open_ranges and position < start:
+            yield position, start - 1, open_ranges[-1][1]
+        position = start
+        open_ranges.append((end, value))
+    while open_ranges:
+        top_end, top_value = open_ranges.pop()
+        if position <= top_end:
+            yield position, top_end, top_value
+            position = top_end + 1
+
+
+def _parse_dataset(lines: Iterable[str]) -> Iterator[tuple[int, int, tuple]]:
+    # (AS, country, description) per range from any of:
+    #   iptoasn.com ip2asn-v4.tsv:  first_ip <TAB> last_ip <TAB> asn <TAB> country <TAB> description
+    #   RIR delegation files:       registry|cc|ipv4|start|count|date|status
+    #   prefix to AS (RIB dumps):   prefix/length asn   or   CAIDA pfx2as: network <TAB> length <TAB> asn
+    for line in lines:
+        if not line.strip() or line.startswith("#"):
+            continue
+        try:
+            if "|" in line:
+                fields = line.rstrip("\n").split("|")
+                if len(fields) < 7 or fields[2] != "ipv4" or fields[3] == "*":
+                    continue
+                start = ip_to_int(fields[3])
+                yield start, start + int(fields[4]) - 1, ("-", fields[1] or "-", "-")
+                continue
+
+            fields = line.rstrip("\n").split("\t") if "\t" in line else line.split()
+            if "/" in fields[0]:
+                start, end = prefix_range(fields[0])
+                yield start, end, (_as_name(fields[1]), "-", "-")
+            elif len(fields) >= 4 and "." in fields[1]:
+                if fields[2] == "0":
+                    # iptoasn marks unrouted space with AS 0
+                    continue
+                description = fields[4].strip() if len(fields) > 4 else "-"
+                yield ip_to_int(fields[0]), ip_to_int(fields[1]), (_as_name(fields[2]), fields[3], description)
+            elif len(fields) >= 3:
+                start, end = prefix_range(f"{fields[0]}/{fields[1]}")
+                yield start, end, (_as_name(fields[2]), "-", "-")
+        except (OSError, ValueError, IndexError):
+            # a malformed line or an IPv6 range
+            continue
+
+
+def _as_name(asn: str) -> str:
+    # multi-origin prefixes are written as 123_456 or {123,456}; the first origin is enough here
+    asn = asn.strip("{}").replace("_", ",").split(",")[0]
+    return asn if asn.upper().startswith("AS") else "AS" + asn
+
+
+RESERVED_INDEX = PrefixIndex((*prefix_range(prefix), (label,)) for prefix, label in RESERVED_RANGES)
+
+
+def reserved_range(ip: str) -> str | None:
+    value = RESERVED_INDEX.lookup(ip)
+    return value[0] if value else None
@@ -1,15 +1,37 @@
 import subprocess
 import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterator
 from urllib.request import urlopen
 from urllib.error import URLError, HTTPError
 from re import compile as re_compile
 
-IP_REG = re_compile(r"\b\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}\b[^.]")
+from prefixIndex import PrefixIndex, reserved_range
+
+IP_REG = re_compile(r"\b(\d{1,3}(?:\.\d{1,3}){3})\b(?!\.)")
+HOP_REG = re_compile(r"^\s*(\d+)\s")
 AS_REG = re_compile(r"[Oo]riginA?S?: *([\d\w]+?)\n")
 COUNTRY_REG = re_compile(r"[Cc]ountry: *([\w]+?)\n")
 PROVIDER_REG = re_compile(r"mnt-by: *([\w\d-]+?)\n")
+WHOIS_URL = "https://www.nic.ru/whois/?searchWord={ip}"
+FIELDS = ("destination", "hop", "ip", "as", "country", "provider")
 ARG_PARSER = argparse.ArgumentParser()
 destination = ""
+destinations_file = ""
+traces = 4
+output_file = ""
+output_format = "jsonl"
+whois_url = WHOIS_URL
+workers = 8
+ip_cache: "IpInfoCache | None" = None
+prefix_index: PrefixIndex | None = None
+offline = False
 
 
 class IpInfo:
@@ -20,57 +42,269 @@ class IpInfo:
         self.provider = provider
 
 
+class IpInfoCache:
+    # WHOIS answers are kept per /24: the hops of one backbone mostly share their networks
+    def __init__(self, file_name: str, ttl: float):
+        self.file_name = file_name
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: dict[str, list] = dict()
+        self._changed = False
+        self.__load()
+
+    @staticmethod
+    def prefix(ip: str) -> str:
+        return ip.rsplit(".", 1)[0] + ".0/24"
+
+    def get(self, ip: str) -> IpInfo | None:
+        with self._lock:
+            entry = self._entries.get(self.prefix(ip))
+        if entry is None or entry[3] + self.ttl <= time.time():
+            return None
+        return IpInfo(ip, *entry[:3])
+
+    def put(self, ip_info: IpInfo) -> None:
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[self.prefix(ip_info.ip)] = [ip_info.as_, ip_info.country, ip_info.provider, time.time()]
+            self._changed = True
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._changed:
+                return
+            now = time.time()
+            entries = {prefix: entry for prefix, entry in self._entries.items() if entry[3] + self.ttl > now}
+            self._changed = False
+        tmp_name = self.file_name + ".tmp"
+        with open(tmp_name, "w") as cache_file:
+            json.dump(entries, cache_file)
+        os.replace(tmp_name, self.file_name)
+
+    def __load(self) -> None:
+        try:
+            with open(self.file_name) as cache_file:
+                self._entries = json.load(cache_file)
+        except (OSError, ValueError):
+            self._entries = dict()
+
+
+class HopPrinter:
+    # lookups finish in any order, rows are printed in hop order as soon as the prefix of them is known
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ips: list[str] = list()
+        self._done: dict[int, IpInfo] = dict()
+        self._next = 0
+
+    def expect(self, ip: str, lookup: Future) -> None:
+        with self._lock:
+            index = len(self._ips)
+            self._ips.append(ip)
+        lookup.add_done_callback(lambda done: self.__done(index, done))
+
+    def __done(self, index: int, lookup: Future) -> None:
+        info = lookup.result()
+        with self._lock:
+            self._done[index] = info
+            while self._next in self._done:
+                info = self._done.pop(self._next)
+                print_info(IpInfo(self._ips[self._next], info.as_, info.country, info.provider))
+                self._next += 1
+
+
+class HopLookups:
+    # one lookup per prefix for every trace of the run, started as soon as a hop is seen
+    def __init__(self, pool: ThreadPoolExecutor):
+        self._pool = pool
+        self._lock = threading.Lock()
+        self._lookups: dict[str, Future] = dict()
+
+    def lookup(self, ip: str) -> Future:
+        prefix = IpInfoCache.prefix(ip)
+        with self._lock:
+            if prefix not in self._lookups:
+                self._lookups[prefix] = self._pool.submit(get_ip_info, ip)
+            return self._lookups[prefix]
+
+
+class RecordWriter:
+    def __init__(self, file, output_format: str):
+        self._file = file
+        self._lock = threading.Lock()
+        self._csv = None
+        if output_format == "csv":
+            self._csv = csv.DictWriter(file, FIELDS)
+            self._csv.writeheader()
+
+    def write(self, records: list[dict]) -> None:
+        # the rows of one trace stay together
+        with self._lock:
+            for record in records:
+                if self._csv is not None:
+                    self._csv.writerow(record)
+                else:
+                    self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+
 def main() -> None:
     process_key()
-    trace_res = subprocess.run(['tracert', destination], stdout=subprocess.PIPE).stdout.decode("ISO-8859-1")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        lookups = HopLookups(pool)
+        if destinations_file:
+            trace_batch(lookups)
+        else:
+            trace_one(lookups)
+    ip_cache.save()
+
+
+def trace_one(lookups: HopLookups) -> None:
     print_info(IpInfo("IP", "AS", "Country", "Provider"))
-    for ip in IP_REG.findall(trace_res)[1:]:
-        print_info(get_ip_info(ip.strip("]")))
+    printer = HopPrinter()
+    for _, ip in trace_hops(destination):
+        printer.expect(ip, lookups.lookup(ip))
+
+
+def trace_batch(lookups: HopLookups) -> None:
+    with open(destinations_file) as file:
+        targets = [line.strip() for line in file if line.strip() and not line.startswith("#")]
+
+    output = open(output_file, "w", newline="", encoding="utf-8") if output_file else sys.stdout
+    try:
+        writer = RecordWriter(output, output_format)
+        with ThreadPoolExecutor(max_workers=traces) as tracers:
+            done = 0
+            for target, hops in zip(targets, tracers.map(lambda target: trace_records(target, lookups), targets)):
+                done += 1
+                print(f"[{done}/{len(targets)}] {target}: {len(hops)} hops", file=sys.stderr)
+                writer.write(hops)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+def trace_records(target: str, lookups: HopLookups) -> list[dict]:
+    hops = [(hop, ip, lookups.lookup(ip)) for hop, ip in trace_hops(target)]
+    records = list()
+    for hop, ip, lookup in hops:
+        info = lookup.result()
+        records.append({
+            "destination": target,
+            "hop": hop,
+            "ip": ip,
+            "as": info.as_,
+            "country": info.country,
+            "provider": info.provider
+        })
+    return records
+
+
+def trace_command(target: str) -> list[str]:
+    # numeric output only: resolving every hop name would slow the trace down
+    if sys.platform == "win32":
+        return ["tracert", "-d", target]
+    return ["traceroute", "-n", target]
+
+
+def trace_hops(target: str) -> Iterator[tuple[int, str]]:
+    with subprocess.Popen(trace_command(target), stdout=subprocess.PIPE) as process:
+        for line in process.stdout:
+            line = line.decode("ISO-8859-1")
+            # the header line holds the destination address, lines of silent hops hold none
+            hop = HOP_REG.match(line)
+            if not hop:
+                continue
+            ip = IP_REG.search(line)
+            if ip:
+                yield int(hop.group(1)), ip.group(1)
 
 
 def download_page(url: str) -> str:
     try:
-        with urlopen(url) as page:
+        with urlopen(url, timeout=10) as page:
             content = page.read().decode('utf-8', errors='ignore')
             return content
-    except (URLError, HTTPError):
+    except (URLError, HTTPError, OSError):
         return ""
 
 
 def get_ip_info(ip: str) -> IpInfo:
     def try_get(reg) -> str:
         res = reg.search(page)
-        if res:
-            return reg.search(page).group(1)
-        else:
-            return "-"
+        return res.group(1) if res else "-"
 
-    if is_grey_ip(ip):
-        return IpInfo(ip, "Grey IP", "", "")
+    reserved = reserved_range(ip)
+    if reserved is not None:
+        return IpInfo(ip, "Grey IP", "", reserved)
 
-    page = download_page(f"https://www.nic.ru/whois/?searchWord={ip}")
-    return IpInfo(
+    if prefix_index is not None:
+        indexed = prefix_index.lookup(ip)
+        if indexed is not None:
+            return IpInfo(ip, *indexed)
+    if offline:
+        return IpInfo(ip, "-", "-", "-")
+
+    cached = ip_cache.get(ip)
+    if cached is not None:
+        return cached
+
+    page = download_page(whois_url.format(ip=ip))
+    ip_info = IpInfo(
         ip,
         try_get(AS_REG),
         try_get(COUNTRY_REG),
         try_get(PROVIDER_REG)
     )
-
-
-def is_grey_ip(ip: str) -> bool:
-    return (ip.startswith("192.168.") or
-            ip.startswith("10.") or
-            ip.startswith("172.") and 15 < int(ip.split(".")[1]) < 32)
+    if page:
+        ip_cache.put(ip_info)
+    return ip_info
 
 
 def process_key() -> None:
     def configure_arg_parser() -> None:
-        ARG_PARSER.add_argument("-d", "--destination", dest="destination", required=True)
+        targets = ARG_PARSER.add_mutually_exclusive_group(required=True)
+        targets.add_argument("-d", "--destination", dest="destination")
+        targets.add_argument("-f", "--file", dest="destinations_file",
+                             help="Файл со списком адресов, по одному в строке: трассировки идут параллельно, "
+                                  "результат пишется в JSONL или CSV")
+        ARG_PARSER.add_argument("-t", "--traces", dest="traces", type=int, default=4,
+                                help="Сколько трассировок запускать одновременно в режиме --file")
+        ARG_PARSER.add_argument("-o", "--output", dest="output_file", default="",
+                                help="Файл результата режима --file, по умолчанию stdout")
+        ARG_PARSER.add_argument("--format", dest="output_format", choices=("jsonl", "csv"), default="jsonl")
+        ARG_PARSER.add_argument("-w", "--workers", dest="workers", type=int, default=8,
+                                help="Сколько адресов узнавать одновременно")
+        ARG_PARSER.add_argument("--whois-url", dest="whois_url", default=WHOIS_URL,
+                                help="Адрес WHOIS страницы, {ip} заменяется на адрес")
+        ARG_PARSER.add_argument("--cache-file", dest="cache_file", default="traceAS_cache.json",
+                                help="Файл кэша ответов WHOIS")
+        ARG_PARSER.add_argument("--index", dest="index_file",
+                                help="Локальная база префиксов: ip2asn-v4.tsv, файл делегирования RIR "
+                                     "или префикс-AS из RIB; найденные в ней адреса не ищутся в WHOIS")
+        ARG_PARSER.add_argument("--offline", dest="offline", action="store_true",
+                                help="Не обращаться к WHOIS, только база --index")
+        ARG_PARSER.add_argument("--cache-ttl", dest="cache_ttl", type=float, default=24 * 7,
+                                help="Сколько часов хранить ответы в кэше, 0 - не использовать кэш")
 
-    global destination
+    global destination, destinations_file, traces, output_file, output_format, whois_url, workers, ip_cache, \
+        prefix_index, offline
     configure_arg_parser()
     args = ARG_PARSER.parse_args()
+    if args.offline and not args.index_file:
+        ARG_PARSER.error("--offline нужна база --index")
+    offline = args.offline
+    if args.index_file:
+        prefix_index = PrefixIndex.load(args.index_file)
     destination = args.destination
+    destinations_file = args.destinations_file
+    traces = max(args.traces, 1)
+    output_file = args.output_file
+    output_format = args.output_format
+    whois_url = args.whois_url
+    workers = max(args.workers, 1)
+    ip_cache = IpInfoCache(args.cache_file, args.cache_ttl * 3600)
 
 
 def print_info(ip_info: IpInfo) -> None:
@@ -83,4 +317,5 @@ if __name__ == "__main__":
     except Exception as e:
         print(e)
     finally:
-        input("\nДля выхода нажмите Enter...")
+        if not destinations_file:
+            input("\nДля выхода нажмите Enter...")
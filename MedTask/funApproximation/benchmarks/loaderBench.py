@@ -0,0 +1,102 @@
+import gc
+import os
+import re
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+import numpy as np
+
+from fitting import MODELS
+from loader import parse_input
+
+
+def legacy_parse_input(file_name: str) -> (list[float], list[float]):
+    x_data = list()
+    y_data = list()
+    x_y_data = list()
+    parse_regex = re.compile(r"([\d,]+)[ \t]+(\d+)")
+    with open(file_name, mode="r") as file:
+        for line in file.readlines():
+            pair = parse_regex.search(line)
+            x_y_data.append((float(pair.group(1).replace(",", ".")), float(pair.group(2).replace(",", "."))))
+
+    x_y_data.sort(key=lambda e: e[0])
+    for pair in x_y_data:
+        x_data.append(pair[0])
+        y_data.append(pair[1])
+    return x_data, y_data
+
+
+def write_input(file_name: str, rows: int, seed: int) -> None:
+    # the shape of input.txt: unsorted x with a decimal comma, integer y
+    rng = np.random.default_rng(seed)
+    with open(file_name, "w") as file:
+        for start in range(0, rows, 1_000_000):
+            count = min(1_000_000, rows - start)
+            x = rng.uniform(1, 50, count)
+            y = np.maximum(np.round(20 * np.log(x) + 10 + rng.normal(0, 3, count)), 0)
+            lines = np.char.add(np.char.add(np.char.mod("%.2f", x), "\t"), np.char.mod("%d", y))
+            file.write("\n".join(np.char.replace(lines, ".", ",").tolist()) + "\n")
+
+
+def timed(function, *args) -> tuple[object, float]:
+    gc.collect()
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def peak_memory(function, *args) -> float:
+    # a separate run: tracing every allocation would slow the timed one down, the legacy path most
+    gc.collect()
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+def legacy_evaluate(x_data: list[float], fits: list[tuple]) -> None:
+    for function, parameters in fits:
+        list(map(lambda x: function(x, *parameters), x_data))
+
+
+def evaluate(x_data: np.ndarray, fits: list[tuple]) -> None:
+    for function, parameters in fits:
+        function(x_data, *parameters)
+
+
+def main() -> None:
+    arg_parser = ArgumentParser(description="Compare the line by line loader and model evaluation with the NumPy ones")
+    arg_parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    arg_parser.add_argument("--seed", type=int, default=1)
+    arg_parser.add_argument("--memory", action="store_true", help="also measure the peak memory of loading")
+    args = arg_parser.parse_args()
+
+    # fitted to input.txt, only the cost of evaluating them matters here
+    parameters = {
+        "first_order_polynom": (0.79, 34.0),
+        "second_order_polynom": (-0.0046, 1.0, 32.0),
+        "third_order_polynom": (4.5e-5, -0.008, 1.09, 31.6),
+        "elog_like": (12.5, 15.8),
+        "log_like": (64.8, 59.1, -232.9),
+        "exp_like": (2.5e-20, 51.8),
+    }
+    fits = [(model.function, parameters[model.name]) for model in MODELS]
+    print(f"{'rows':>10} {'path':>7} {'load s':>8} {'load MB':>8} {'eval s':>8}")
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, "input.txt")
+            write_input(file_name, rows, args.seed)
+            for path, load, run in (("legacy", legacy_parse_input, legacy_evaluate), ("numpy", parse_input, evaluate)):
+                (x_data, y_data), load_time = timed(load, file_name)
+                _, eval_time = timed(run, x_data, fits)
+                del x_data, y_data
+                load_peak = f"{peak_memory(load, file_name):.0f}" if args.memory else "-"
+                print(f"{rows:>10} {path:>7} {load_time:>8.2f} {load_peak:>8} {eval_time:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
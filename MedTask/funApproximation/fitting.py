@@ -0,0 +1,276 @@
+import time
+import warnings
+from math import e
+from multiprocessing import Pool, TimeoutError
+from typing import Callable, NamedTuple
+
+import numpy as np
+from numpy import log
+from scipy.optimize import OptimizeWarning, curve_fit
+
+
+def first_order_polynom(x, a, b):
+    return a*x + b
+
+
+def second_order_polynom(x, a, b, c):
+    return a*(x**2) + b*x + c
+
+
+def third_order_polynom(x, a, b, c, d):
+    return a*(x**3) + b*(x**2) + c*x + d
+
+
+def log_like(x, a, b, c):
+    # a log with its origin shifted by `b`; a free base would only scale `a` and fit as elog_like
+    return a*log(x + b)+c
+
+
+def elog_like(x, a, b):
+    return a*log(x)+b
+
+
+def exp_like(x, a, b):
+    return a*(e**x) + b
+
+
+class Model(NamedTuple):
+    name: str
+    function: Callable
+    # models linear in their parameters give the columns of the design matrix and are solved
+    # in closed form, the rest go to curve_fit starting from `guess`
+    basis: Callable | None = None
+    guess: Callable | None = None
+
+
+def _log_like_guess(x, y):
+    # the smallest shift that keeps every x inside the log, then elog_like's closed form for the rest
+    shift = 0.0 if x.min() > 0 else 1.0 - x.min()
+    slope, intercept = _solve(_elog_basis(x + shift), y)
+    return slope, shift, intercept
+
+
+def _elog_basis(x):
+    return np.log(x), np.ones_like(x)
+
+
+MODELS = (
+    Model("first_order_polynom", first_order_polynom, lambda x: (x, np.ones_like(x))),
+    Model("second_order_polynom", second_order_polynom, lambda x: (x ** 2, x, np.ones_like(x))),
+    Model("third_order_polynom", third_order_polynom, lambda x: (x ** 3, x ** 2, x, np.ones_like(x))),
+    Model("elog_like", elog_like, _elog_basis),
+    Model("log_like", log_like, guess=_log_like_guess),
+    Model("exp_like", exp_like, lambda x: (np.exp(x), np.ones_like(x))),
+)
+CRITERIA = ("aic", "bic", "rss")
+
+
+class Fit(NamedTuple):
+    model: Model
+    parameters: tuple
+    rss: float
+    aic: float
+    bic: float
+    status: str
+    seconds: float
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "ok"
+
+
+def fit_models(
+        x_data,
+        y_data,
+        models: tuple[Model, ...] = MODELS,
+        criterion: str = "aic",
+        timeout: float = 10.0,
+        workers: int | None = None
+) -> list[Fit]:
+    # Closed form models are solved here, curve_fit ones run in a process pool, each within
+    # `timeout` seconds. The fits come back best first by `criterion`, failed ones last.
+    x = np.asarray(x_data, dtype=float)
+    y = np.asarray(y_data, dtype=float)
+    nonlinear = [model for model in models if model.basis is None]
+    fits = dict()
+    if nonlinear and workers != 0:
+        with Pool(min(workers or len(nonlinear), len(nonlinear))) as pool:
+            pending = [(model, pool.apply_async(_fit_nonlinear, (model, x, y))) for model in nonlinear]
+            for model in models:
+                if model.basis is not None:
+                    fits[model.name] = _fit(model, x, y)
+            deadline = time.perf_counter() + timeout
+            for model, result in pending:
+                try:
+                    fits[model.name] = result.get(max(deadline - time.perf_counter(), 0))
+                except TimeoutError:
+                    fits[model.name] = _failed(model, "timeout", timeout)
+                except Exception as err:
+                    # whatever one model throws, the others are still reported
+                    fits[model.name] = _failed(model, f"{type(err).__name__}: {err}", 0.0)
+            # leaving the block terminates the workers still busy with timed out fits
+    else:
+        for model in models:
+            fits[model.name] = _fit(model, x, y)
+
+    ranked = [fits[model.name] for model in models]
+    ranked.sort(key=lambda fit: (not fit.ok, getattr(fit, criterion)))
+    return ranked
+
+
+def _fit(model: Model, x: np.ndarray, y: np.ndarray) -> Fit:
+    if model.basis is None:
+        return _fit_nonlinear(model, x, y)
+    started = time.perf_counter()
+    try:
+        with np.errstate(all="ignore"):
+            parameters = _solve(model.basis(x), y)
+    except (np.linalg.LinAlgError, ValueError) as err:
+        return _failed(model, str(err), time.perf_counter() - started)
+    return _scored(model, x, y, parameters, time.perf_counter() - started)
+
+
+def _fit_nonlinear(model: Model, x: np.ndarray, y: np.ndarray, start: tuple | None = None) -> Fit:
+    started = time.perf_counter()
+    try:
+        with warnings.catch_warnings(), np.errstate(all="ignore"):
+            warnings.simplefilter("ignore", OptimizeWarning)
+            p0 = start if start is not None else model.guess(x, y)
+            parameters, _ = curve_fit(model.function, x, y, p0=p0, maxfev=10000)
+    except (RuntimeError, ValueError, TypeError, np.linalg.LinAlgError, FloatingPointError) as err:
+        # curve_fit raises TypeError when there are fewer points than parameters
+        return _failed(model, str(err), time.perf_counter() - started)
+    return _scored(model, x, y, parameters, time.perf_counter() - started)
+
+
+class RunningQR:
+    # The R factor of the QR decomposition of [A | y] for a model linear in its parameters: adding
+    # rows costs as much as the rows, and the fit and its residual come from R alone. Sums like A'A
+    # would square the condition number, which x**3 far from 0 does not survive.
+    def __init__(self, model: Model):
+        self.model = model
+        self.n = 0
+        self.r: np.ndarray | None = None
+        self.defined = True
+
+    def add(self, x: np.ndarray, y: np.ndarray) -> None:
+        self.n += len(y)
+        if not self.defined:
+            return
+        with np.errstate(all="ignore"):
+            rows = np.column_stack(self.model.basis(x) + (y,))
+            if self.r is not None:
+                rows = np.vstack((self.r, rows))
+            if np.all(np.isfinite(rows)):
+                self.r = np.linalg.qr(rows, mode="r")
+            if not np.all(np.isfinite(rows)) or not np.all(np.isfinite(self.r)):
+                self.defined = False
+
+    def fit(self) -> Fit:
+        started = time.perf_counter()
+        if not self.n:
+            return _failed(self.model, "no points yet", 0.0)
+        if not self.defined:
+            return _failed(self.model, "the model is undefined on this data", time.perf_counter() - started)
+        k = self.r.shape[1] - 1
+        # fewer rows than columns give a shorter R
+        r = np.zeros((k + 1, k + 1))
+        r[:len(self.r)] = self.r
+        design, target = r[:k, :k], r[:k, k]
+        with np.errstate(all="ignore"):
+            scale = np.linalg.norm(design, axis=0)
+            if not np.all(np.isfinite(scale)) or not np.all(scale > 0):
+                return _failed(self.model, "the model is undefined on this data", time.perf_counter() - started)
+            # the same unit column scaling as _solve
+            solution, *_ = np.linalg.lstsq(design / scale, target, rcond=None)
+            parameters = solution / scale
+            rss = float(np.sum((design @ parameters - target) ** 2) + r[k, k] ** 2)
+        return _score(self.model, parameters, rss, self.n, time.perf_counter() - started)
+
+
+class OnlineFitter:
+    # Fits of a data set that keeps growing. Linear models only update their RunningQR.
+    # curve_fit ones see a uniform sample of at most SAMPLE_SIZE points, kept by reservoir
+    # sampling, and start from their last parameters, which usually leaves them a few iterations.
+    SAMPLE_SIZE = 100000
+
+    def __init__(self, models: tuple[Model, ...] = MODELS, criterion: str = "aic", seed: int = 0):
+        self.models = models
+        self.criterion = criterion
+        self.sums = {model.name: RunningQR(model) for model in models if model.basis is not None}
+        self.starts: dict[str, tuple] = dict()
+        self.sample_x = np.empty(0)
+        self.sample_y = np.empty(0)
+        self.n = 0
+        self._random = np.random.default_rng(seed)
+
+    def add(self, x_data, y_data) -> None:
+        x = np.asarray(x_data, dtype=float)
+        y = np.asarray(y_data, dtype=float)
+        for sums in self.sums.values():
+            sums.add(x, y)
+        if len(self.sums) < len(self.models):
+            self.__sample(x, y)
+        self.n += len(y)
+
+    def fit(self) -> list[Fit]:
+        fits = list()
+        for model in self.models:
+            if model.name in self.sums:
+                fits.append(self.sums[model.name].fit())
+                continue
+            fit = _fit_nonlinear(model, self.sample_x, self.sample_y, self.starts.get(model.name))
+            if fit.ok:
+                self.starts[model.name] = fit.parameters
+                if len(self.sample_y) < self.n:
+                    # the residual of the sample stands for all the points
+                    fit = _score(model, fit.parameters, fit.rss * self.n / len(self.sample_y), self.n, fit.seconds)
+            fits.append(fit)
+        fits.sort(key=lambda fit: (not fit.ok, getattr(fit, self.criterion)))
+        return fits
+
+    def __sample(self, x: np.ndarray, y: np.ndarray) -> None:
+        free = min(self.SAMPLE_SIZE - len(self.sample_y), len(y))
+        if free > 0:
+            self.sample_x = np.concatenate((self.sample_x, x[:free]))
+            self.sample_y = np.concatenate((self.sample_y, y[:free]))
+        if free == len(y):
+            return
+        # point i of the data replaces a random one of the sample with probability SAMPLE_SIZE / (i + 1)
+        seen = self.n + free + np.arange(len(y) - free)
+        slots = (self._random.random(len(seen)) * (seen + 1)).astype(np.int64)
+        kept = slots < self.SAMPLE_SIZE
+        self.sample_x[slots[kept]] = x[free:][kept]
+        self.sample_y[slots[kept]] = y[free:][kept]
+
+
+def _solve(columns: tuple, y: np.ndarray) -> np.ndarray:
+    # columns are scaled to unit norm first: x**3 next to a column of ones is badly conditioned
+    design = np.column_stack(columns)
+    norms = np.linalg.norm(design, axis=0)
+    if not np.all(np.isfinite(design)) or not np.all(norms > 0):
+        raise ValueError("the model is undefined on this data")
+    solution, *_ = np.linalg.lstsq(design / norms, y, rcond=None)
+    return solution / norms
+
+
+def _scored(model: Model, x: np.ndarray, y: np.ndarray, parameters, seconds: float) -> Fit:
+    with np.errstate(all="ignore"):
+        rss = float(np.sum((y - model.function(x, *parameters)) ** 2))
+    return _score(model, parameters, rss, len(y), seconds)
+
+
+def _score(model: Model, parameters, rss: float, n: int, seconds: float) -> Fit:
+    if not np.isfinite(rss) or not np.all(np.isfinite(parameters)):
+        return _failed(model, "the fit diverged", seconds)
+    k = len(parameters)
+    if n <= k:
+        return _failed(model, "not enough points", seconds)
+    # Gaussian likelihood with the variance estimated from the residuals
+    likelihood = n * np.log(max(rss, np.finfo(float).tiny) / n)
+    return Fit(model, tuple(float(p) for p in parameters), rss,
+               float(likelihood + 2 * k), float(likelihood + k * np.log(n)), "ok", seconds)
+
+
+def _failed(model: Model, status: str, seconds: float) -> Fit:
+    return Fit(model, (), float("inf"), float("inf"), float("inf"), status, seconds)
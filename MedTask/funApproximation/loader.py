@@ -0,0 +1,42 @@
+import warnings
+
+import numpy as np
+
+CHUNK_SIZE = 1 << 24
+
+
+def parse_input(file_name: str, chunk_size: int = CHUNK_SIZE) -> (np.ndarray, np.ndarray):
+    # Two columns of numbers, decimal commas allowed, read in chunks cut at line ends and parsed
+    # by NumPy, so only one chunk of text is held next to the arrays. The points come back sorted by x.
+    parts = list()
+    tail = b""
+    with open(file_name, mode="rb") as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            chunk = tail + chunk
+            end = chunk.rfind(b"\n") + 1
+            tail = chunk[end:]
+            parts.append(parse_chunk(chunk[:end]))
+    parts.append(parse_chunk(tail))
+    points = np.concatenate(parts)
+    order = np.argsort(points[:, 0], kind="stable")
+    return points[order, 0], points[order, 1]
+
+
+def parse_chunk(data: bytes) -> np.ndarray:
+    # whole lines of "x y" pairs into an (n, 2) array
+    if not data.strip():
+        # fromstring reads blank text as a single -1
+        return np.empty((0, 2))
+    with warnings.catch_warnings():
+        # text that cannot be read to the end is a ValueError since NumPy 2, a DeprecationWarning before
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            values = np.fromstring(data.replace(b",", b"."), dtype=float, sep=" ")
+        except (ValueError, DeprecationWarning):
+            raise ValueError("input lines must be two numbers: x y") from None
+    if len(values) % 2:
+        raise ValueError("input lines must be two numbers: x y")
+    return values.reshape(-1, 2)
@@ -1,83 +1,174 @@
+import csv
+import json
+import os
+import sys
+import time
 from argparse import ArgumentParser
-from math import e
-from scipy.optimize import curve_fit
-from numpy import log
+from glob import glob
 from matplotlib import pyplot as plt
-import re
 
-DESTINATION = ""
-
-
-def first_order_polynom(x, a, b):
-    return a*x + b
-
-
-def second_order_polynom(x, a, b, c):
-    return a*(x**2) + b*x + c
-
-
-def third_order_polynom(x, a, b, c, d):
-    return a*(x**3) + b*(x**2) + c*x + d
-
-
-def log_like(x, a, b, c):
-    return b*(log(x) / log(a))+c  # `log(x) / log(a)` to get log with `a` base. Got errors there, so don't used it
+from fitting import CRITERIA, Fit, OnlineFitter, fit_models
+from loader import CHUNK_SIZE, parse_chunk, parse_input
+from plotting import plot_fits
 
-
-def elog_like(x, a, b):
-    return a*log(x)+b
-
-
-def exp_like(x, a, b):
-    return a*(e**x) + b
+DESTINATION = ""
+BATCH: list[str] = list()
+RESULTS = ""
+PLOTS = ""
+PLOT_FORMAT = "png"
+CRITERION = "aic"
+TIMEOUT = 10.0
+WORKERS = None
+FOLLOW = False
+INTERVAL = 5.0
+RESULT_FIELDS = ("file", "rank", "model", "status", "rss", "aic", "bic", "parameters")
 
 
 def main() -> None:
     process_key()
+    if BATCH:
+        run_batch()
+        return
+    if FOLLOW:
+        follow()
+        return
     x_data, y_data = parse_input(DESTINATION)
-    popt1, _ = curve_fit(first_order_polynom, x_data, y_data)
-    popt2, _ = curve_fit(second_order_polynom, x_data, y_data)
-    popt3, _ = curve_fit(third_order_polynom, x_data, y_data)
-    popt4, _ = curve_fit(elog_like, x_data, y_data)
-    popt5, _ = curve_fit(exp_like, x_data, y_data)
-
-    plt.plot(x_data, y_data, 'bo', label='y - original')
-    plt.plot(x_data, list(map(lambda x: first_order_polynom(x, popt1[0], popt1[1]), x_data)), label='first_order_polynom')
-    plt.plot(x_data, list(map(lambda x: second_order_polynom(x, popt2[0], popt2[1], popt2[2]), x_data)), label='second_order_polynom')
-    plt.plot(x_data, list(map(lambda x: third_order_polynom(x, popt3[0], popt3[1], popt3[2], popt3[3]), x_data)), label='third_order_polynom')
-    plt.plot(x_data, list(map(lambda x: elog_like(x, popt4[0], popt4[1]), x_data)), label='elog_like')
-    plt.plot(x_data, list(map(lambda x: exp_like(x, popt5[0], popt5[1]), x_data)), label='exp_like')
-    plt.legend(loc='best', fancybox=True, shadow=True)
-    plt.grid(True)
+    fits = fit_models(x_data, y_data, criterion=CRITERION, timeout=TIMEOUT, workers=WORKERS)
+    print_fits(fits)
+    plot_fits(x_data, y_data, fits)
     plt.show()
 
 
-def parse_input(file_name: str) -> (list[float], list[float]):
-    x_data = list()
-    y_data = list()
-    x_y_data = list()
-    parse_regex = re.compile("([\d,]+)[ \t]+(\d+)")
-    with open(file_name, mode="r") as file:
-        for line in file.readlines():
-            pair = parse_regex.search(line)
-            x_y_data.append((float(pair.group(1).replace(",", ".")), float(pair.group(2).replace(",", "."))))
+def run_batch() -> None:
+    # no window and no questions: every file is fitted, the results and plots go to files
+    plt.switch_backend("Agg")
+    if PLOTS:
+        os.makedirs(PLOTS, exist_ok=True)
+    rows = list()
+    for i, file_name in enumerate(BATCH, 1):
+        try:
+            x_data, y_data = parse_input(file_name)
+            if len(x_data) < 2:
+                raise ValueError("not enough points")
+            fits = fit_models(x_data, y_data, criterion=CRITERION, timeout=TIMEOUT, workers=WORKERS)
+        except (OSError, ValueError) as err:
+            print(f"[{i}/{len(BATCH)}] {file_name}: {err}", file=sys.stderr)
+            rows.append(dict(file=file_name, rank=None, model=None, status=str(err), rss=None, aic=None, bic=None,
+                             parameters=None))
+            continue
+        best = fits[0]
+        print(f"[{i}/{len(BATCH)}] {file_name}: {len(x_data)} points, best {best.model.name} "
+              f"({CRITERION} {getattr(best, CRITERION):.6g})", file=sys.stderr)
+        rows.extend(result_row(file_name, rank, fit) for rank, fit in enumerate(fits, 1))
+        if PLOTS:
+            figure = plot_fits(x_data, y_data, fits, os.path.basename(file_name))
+            figure.savefig(os.path.join(PLOTS, f"{os.path.splitext(os.path.basename(file_name))[0]}.{PLOT_FORMAT}"))
+            plt.close(figure)
+    write_results(rows)
+
+
+def follow() -> None:
+    # Fits are refreshed every INTERVAL seconds from the lines appended since the last look;
+    # a file that got shorter was rewritten and is read again from the start.
+    fitter = OnlineFitter(criterion=CRITERION)
+    tail = b""
+    with open(DESTINATION, mode="rb") as file:
+        try:
+            while True:
+                if os.fstat(file.fileno()).st_size < file.tell():
+                    file.seek(0)
+                    fitter, tail = OnlineFitter(criterion=CRITERION), b""
+                added = 0
+                started = time.perf_counter()
+                while chunk := file.read(CHUNK_SIZE):
+                    chunk = tail + chunk
+                    end = chunk.rfind(b"\n") + 1
+                    tail = chunk[end:]
+                    points = parse_chunk(chunk[:end])
+                    fitter.add(points[:, 0], points[:, 1])
+                    added += len(points)
+                if added:
+                    fits = fitter.fit()
+                    print(f"\n{time.strftime('%H:%M:%S')} +{added} points, {fitter.n} in all, "
+                          f"updated in {(time.perf_counter() - started) * 1000:.1f} ms")
+                    print_fits(fits)
+                time.sleep(INTERVAL)
+        except KeyboardInterrupt:
+            pass
+
+
+def result_row(file_name: str, rank: int, fit: Fit) -> dict:
+    # failed fits have no scores rather than infinite ones, JSON has no infinity
+    return dict(file=file_name, rank=rank if fit.ok else None, model=fit.model.name, status=fit.status,
+                rss=fit.rss if fit.ok else None, aic=fit.aic if fit.ok else None, bic=fit.bic if fit.ok else None,
+                parameters=list(fit.parameters) if fit.ok else None)
+
+
+def write_results(rows: list[dict]) -> None:
+    output = open(RESULTS, "w", newline="", encoding="utf-8") if RESULTS else sys.stdout
+    try:
+        if RESULTS.lower().endswith(".json"):
+            json.dump(rows, output, indent=1)
+            return
+        writer = csv.DictWriter(output, RESULT_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            parameters = row["parameters"]
+            writer.writerow(row | {"parameters": " ".join(repr(p) for p in parameters) if parameters else ""})
+    finally:
+        if output is not sys.stdout:
+            output.close()
 
-    x_y_data.sort(key=lambda e: e[0])
-    for pair in x_y_data:
-        x_data.append(pair[0])
-        y_data.append(pair[1])
-    return x_data, y_data
+
+def print_fits(fits: list[Fit]) -> None:
+    print(f"{'model':<22} {'rss':>12} {'aic':>10} {'bic':>10} {'ms':>8}  parameters")
+    for fit in fits:
+        if fit.ok:
+            parameters = ", ".join(f"{p:.6g}" for p in fit.parameters)
+            print(f"{fit.model.name:<22} {fit.rss:>12.6g} {fit.aic:>10.3f} {fit.bic:>10.3f} "
+                  f"{fit.seconds * 1000:>8.2f}  {parameters}")
+        else:
+            print(f"{fit.model.name:<22} failed: {fit.status}")
 
 
 def process_key() -> None:
     def configure_arg_parser() -> None:
-        arg_parser.add_argument("-d", "--destination", dest="destination", required=True)
-
-    global DESTINATION
+        inputs = arg_parser.add_mutually_exclusive_group(required=True)
+        inputs.add_argument("-d", "--destination", dest="destination")
+        inputs.add_argument("-b", "--batch", dest="batch", nargs="+",
+                            help="Fit every file (masks like data/*.txt are expanded) without a window")
+        arg_parser.add_argument("-r", "--results", dest="results", default="",
+                                help="Batch results, .json or .csv; CSV to stdout by default")
+        arg_parser.add_argument("-p", "--plots", dest="plots", default="",
+                                help="Save a plot per batch file into this folder")
+        arg_parser.add_argument("--plot-format", dest="plot_format", choices=("png", "svg"), default="png")
+        arg_parser.add_argument("-f", "--follow", dest="follow", action="store_true",
+                                help="Keep reading the lines appended to the -d file and refit them")
+        arg_parser.add_argument("-i", "--interval", dest="interval", type=float, default=5.0,
+                                help="Seconds between the refits of --follow")
+        arg_parser.add_argument("-c", "--criterion", dest="criterion", choices=CRITERIA, default="aic",
+                                help="How to rank the fitted models")
+        arg_parser.add_argument("-t", "--timeout", dest="timeout", type=float, default=10.0,
+                                help="Seconds given to the iterative fits")
+        arg_parser.add_argument("-w", "--workers", dest="workers", type=int, default=None,
+                                help="Processes for the iterative fits, 0 fits them in this process")
+
+    global DESTINATION, BATCH, RESULTS, PLOTS, PLOT_FORMAT, CRITERION, TIMEOUT, WORKERS, FOLLOW, INTERVAL
     arg_parser = ArgumentParser()
     configure_arg_parser()
     args = arg_parser.parse_args()
+    if args.follow and not args.destination:
+        arg_parser.error("--follow needs a file to follow: -d")
     DESTINATION = args.destination
+    BATCH = [file_name for mask in args.batch or () for file_name in sorted(glob(mask)) or [mask]]
+    RESULTS = args.results
+    PLOTS = args.plots
+    PLOT_FORMAT = args.plot_format
+    CRITERION = args.criterion
+    TIMEOUT = args.timeout
+    WORKERS = args.workers
+    FOLLOW = args.follow
+    INTERVAL = args.interval
 
 
 if __name__ == "__main__":
@@ -86,4 +177,6 @@ if __name__ == "__main__":
     except Exception as e:
         print(e)
     finally:
-        input("\nFor exit press Enter...")
+        # with the CSV going to stdout a caller would hang on this prompt
+        if not BATCH:
+            input("\nFor exit press Enter...")
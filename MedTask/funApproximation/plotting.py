@@ -0,0 +1,41 @@
+import numpy as np
+from matplotlib import pyplot as plt
+
+from fitting import Fit
+
+
+def plot_fits(x_data: np.ndarray, y_data: np.ndarray, fits: list[Fit], title: str = ""):
+    # Points and curves are cut down to what the figure can show: a few points per pixel column
+    # and one curve point per column, so drawing takes the same time for any input size.
+    figure = plt.figure()
+    columns = int(figure.get_figwidth() * figure.dpi)
+    shown_x, shown_y = decimate(x_data, y_data, columns)
+    plt.plot(shown_x, shown_y, 'bo', label='y - original')
+    curve_x = np.linspace(x_data[0], x_data[-1], columns) if len(x_data) > columns else x_data
+    with np.errstate(all="ignore"):
+        for fit in fits:
+            if fit.ok:
+                plt.plot(curve_x, fit.model.function(curve_x, *fit.parameters), label=fit.model.name)
+    plt.legend(loc='best', fancybox=True, shadow=True)
+    plt.grid(True)
+    if title:
+        plt.title(title)
+    return figure
+
+
+def decimate(x_data: np.ndarray, y_data: np.ndarray, columns: int) -> (np.ndarray, np.ndarray):
+    # x_data is sorted; every column of the plot keeps its lowest and highest point, the rest would
+    # be drawn over them anyway
+    if len(x_data) <= 2 * columns or x_data[-1] == x_data[0]:
+        return x_data, y_data
+    column = ((x_data - x_data[0]) * (columns / (x_data[-1] - x_data[0]))).astype(np.int64)
+    np.minimum(column, columns - 1, out=column)
+    starts = np.flatnonzero(np.diff(column, prepend=-1))
+    lengths = np.diff(starts, append=len(column))
+    lowest = np.flatnonzero(y_data == np.repeat(np.minimum.reduceat(y_data, starts), lengths))
+    highest = np.flatnonzero(y_data == np.repeat(np.maximum.reduceat(y_data, starts), lengths))
+    # ties keep the first point of the column
+    lowest = lowest[np.unique(column[lowest], return_index=True)[1]]
+    highest = highest[np.unique(column[highest], return_index=True)[1]]
+    kept = np.union1d(lowest, highest)
+    return x_data[kept], y_data[kept]